@@ -0,0 +1,241 @@
+import bz2
+import gzip
+import lzma
+import mmap
+import os
+import struct
+import tarfile
+import tempfile
+import warnings
+from compressed import GzipCheckpointReader, Bz2CheckpointReader, XzBlockReader, ChunkedStreamWriter, STREAM_SIZE
+
+COPY_BUFSIZE = 1024 * 1024
+
+COMPRESSION_MAGIC = {
+    'gz': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+}
+ARCHIVE_EXTENSIONS = ('.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def detect_compression(path):
+    with open(path, 'rb') as archive_file:
+        magic = archive_file.read(6)
+    for compression, prefix in COMPRESSION_MAGIC.items():
+        if magic.startswith(prefix):
+            return compression
+    return ''
+
+
+def root_name(path):
+    name = os.path.basename(path)
+    for extension in ARCHIVE_EXTENSIONS:
+        if name.lower().endswith(extension):
+            return name[:-len(extension)]
+    return os.path.splitext(name)[0]
+
+
+class Entry:
+    # Lightweight member record. Tar archives fill in the real header and data
+    # offsets; other backends use offset_data only as their sequential read order.
+    __slots__ = ('name', 'type', 'size', 'offset', 'offset_data')
+
+    def __init__(self, name, type=tarfile.REGTYPE, size=0, offset=0, offset_data=0):
+        self.name = name
+        self.type = type
+        self.size = size
+        self.offset = offset
+        self.offset_data = offset_data
+
+    @classmethod
+    def from_tarinfo(cls, member):
+        return cls(member.name, member.type, member.size, member.offset, member.offset_data)
+
+    def isdir(self):
+        return self.type == tarfile.DIRTYPE
+
+    def isfile(self):
+        return self.type in tarfile.REGULAR_TYPES
+
+
+def open_data(path, compression=''):
+    # Seekable file object over the uncompressed tar stream
+    if compression == 'gz':
+        # Checkpoints let reads seek without decompressing from the start
+        return GzipCheckpointReader(open(path, 'rb'))
+    if compression == 'bz2':
+        # Seeks back to the nearest start of a bz2 stream
+        return Bz2CheckpointReader(open(path, 'rb'))
+    if compression == 'xz':
+        # Seeks straight to the xz block holding the position
+        reader = XzBlockReader(open(path, 'rb'))
+        if len(reader.blocks) == 1 and reader.size > STREAM_SIZE:
+            warnings.warn(f"{path} is a single xz block: every read decompresses it from the start. "
+                          f"Recompress it with 'xz -T0' to make it seekable", RuntimeWarning, stacklevel=2)
+        return reader
+    return open(path, 'rb')
+
+
+def scan_members(fileobj):
+    # Walks every header once. Returns the members in archive order and the
+    # offset where the end-of-archive marker starts.
+    fileobj.seek(0)
+    tar = tarfile.open(fileobj=fileobj, mode='r:')
+    members = [Entry.from_tarinfo(member) for member in tar]
+    end_offset = tar.offset
+    tar.close()
+    return members, end_offset
+
+
+def open_output(raw, compression):
+    if compression == 'gz':
+        return gzip.GzipFile(fileobj=raw, mode='wb')
+    # bz2 and xz images are written as many small streams, so they stay seekable
+    if compression == 'bz2':
+        return ChunkedStreamWriter(raw, bz2.BZ2Compressor)
+    if compression == 'xz':
+        return ChunkedStreamWriter(raw, lambda: lzma.LZMACompressor(lzma.FORMAT_XZ))
+    return raw
+
+
+def member_spans(members, end_offset):
+    # Each member owns the raw bytes from its first header (including any
+    # pax/GNU long name headers) up to the next member's first header
+    for position, member in enumerate(members):
+        if position + 1 < len(members):
+            end = members[position + 1].offset
+        else:
+            end = end_offset
+        yield member, member.offset, end
+
+
+def copy_range(source, destination, start, end):
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = source.read(min(COPY_BUFSIZE, remaining))
+        if not chunk:
+            raise tarfile.ReadError("unexpected end of archive")
+        destination.write(chunk)
+        remaining -= len(chunk)
+
+
+def write_end_of_archive(destination, position):
+    # Two zero blocks, padded up to a full record like tarfile does
+    destination.write(tarfile.NUL * (tarfile.BLOCKSIZE * 2))
+    position += tarfile.BLOCKSIZE * 2
+    remainder = position % tarfile.RECORDSIZE
+    if remainder > 0:
+        destination.write(tarfile.NUL * (tarfile.RECORDSIZE - remainder))
+
+
+def stream_members(source, destination, members, end_offset, keep):
+    # Copies kept members block-for-block. Returns each kept member with the
+    # distance it moved, and the end offset of the new archive.
+    moved = []
+    position = 0
+    for member, start, end in member_spans(members, end_offset):
+        if not keep(member):
+            continue
+        copy_range(source, destination, start, end)
+        moved.append((member, position - start))
+        position += end - start
+    write_end_of_archive(destination, position)
+    return moved, position
+
+
+def rewrite_archive(path, source, members, end_offset, keep, before_replace=None, compression=''):
+    # Writes the new archive next to the old one and swaps it in atomically.
+    # Member offsets are only updated once the swap has succeeded.
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tar.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as raw:
+            destination = open_output(raw, compression)
+            moved, new_end = stream_members(source, destination, members, end_offset, keep)
+            if destination is not raw:
+                destination.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        if before_replace is not None:
+            before_replace()
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    for member, shift in moved:
+        member.offset += shift
+        member.offset_data += shift
+    return [member for member, shift in moved], new_end
+
+
+def in_subtree(name, path):
+    name = name.rstrip('/')
+    return name == path or name.startswith(path + '/')
+
+
+# Sidecar index layout: a header keyed on the archive's size and mtime,
+# fixed-size member records, then all member names back to back
+SIDECAR_MAGIC = b'TARIDX1\0'
+SIDECAR_HEADER = struct.Struct('<8sQqQQ')   # magic, archive size, mtime_ns, count, end offset
+SIDECAR_RECORD = struct.Struct('<cxxxIQQQ')  # type, name length, size, offset, offset_data
+
+
+def sidecar_key(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def save_sidecar(sidecar_path, path, members, end_offset):
+    size, mtime_ns = sidecar_key(path)
+    names = [member.name.encode('utf-8', 'surrogateescape') for member in members]
+    directory = os.path.dirname(os.path.abspath(sidecar_path))
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.idx.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as sidecar:
+            sidecar.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, size, mtime_ns, len(members), end_offset))
+            for member, name in zip(members, names):
+                sidecar.write(SIDECAR_RECORD.pack(
+                    member.type, len(name), member.size, member.offset, member.offset_data
+                ))
+            for name in names:
+                sidecar.write(name)
+        os.replace(temp_path, sidecar_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def load_sidecar(sidecar_path, path):
+    # Returns (members, end_offset), or None when the sidecar is missing or stale
+    try:
+        with open(sidecar_path, 'rb') as sidecar:
+            if os.fstat(sidecar.fileno()).st_size < SIDECAR_HEADER.size:
+                return None
+            with mmap.mmap(sidecar.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                return _parse_sidecar(view, sidecar_key(path))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def _parse_sidecar(view, key):
+    magic, size, mtime_ns, count, end_offset = SIDECAR_HEADER.unpack_from(view, 0)
+    if magic != SIDECAR_MAGIC or (size, mtime_ns) != key:
+        return None
+
+    records_end = SIDECAR_HEADER.size + count * SIDECAR_RECORD.size
+    name_offset = records_end
+    members = []
+    for member_type, name_length, member_size, offset, offset_data in SIDECAR_RECORD.iter_unpack(
+        view[SIDECAR_HEADER.size:records_end]
+    ):
+        name = view[name_offset:name_offset + name_length].decode('utf-8', 'surrogateescape')
+        name_offset += name_length
+        members.append(Entry(name, member_type, member_size, offset, offset_data))
+    if name_offset != len(view):
+        return None
+    return members, end_offset
@@ -0,0 +1,119 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from main import CommandProcessor
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class BatchRunner:
+    # Runs commands through CommandProcessor without a GUI, streaming the
+    # transcript to `out` and recording per-command latency
+    def __init__(self, processor, out, echo=True):
+        self.processor = processor
+        self.out = out
+        self.echo = echo
+        self.latencies = []
+        self.elapsed = 0.0
+        self.finished = False
+
+    def run_command(self, command):
+        if self.echo:
+            self.out.write(f"{self.processor.get_prompt()}{command}\n")
+        started = time.perf_counter()
+        for chunk in self.processor.run(command):
+            self.out.write(chunk)
+        latency = time.perf_counter() - started
+        self.latencies.append(latency)
+        self.elapsed += latency
+        if command == "exit":
+            self.finished = True
+        return latency
+
+    def run(self, lines):
+        for line in lines:
+            command = line.strip()
+            if not command:
+                continue
+            self.run_command(command)
+            if self.finished:
+                break
+        if not self.finished:
+            # End of input ends the session like exit does
+            self.processor.exit()
+            self.finished = True
+        self.out.flush()
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        rate = count / self.elapsed if self.elapsed > 0 else 0.0
+        return {
+            "commands": count,
+            "total_seconds": self.elapsed,
+            "commands_per_second": rate,
+            "latency_ms": {
+                "mean": (self.elapsed / count * 1000) if count else 0.0,
+                "p50": percentile(latencies, 0.50) * 1000,
+                "p95": percentile(latencies, 0.95) * 1000,
+                "p99": percentile(latencies, 0.99) * 1000,
+                "max": (latencies[-1] * 1000) if count else 0.0,
+            },
+        }
+
+    def format_summary(self):
+        summary = self.summary()
+        latency = summary["latency_ms"]
+        return (
+            f"{summary['commands']} commands in {summary['total_seconds']:.3f}s "
+            f"({summary['commands_per_second']:.1f} commands/sec)\n"
+            f"latency ms: mean {latency['mean']:.3f}, p50 {latency['p50']:.3f}, "
+            f"p95 {latency['p95']:.3f}, p99 {latency['p99']:.3f}, max {latency['max']:.3f}\n"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run emulator commands without the GUI')
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'),
+                        help='Path to config.json')
+    parser.add_argument('--script', help="Script to run, '-' for stdin (defaults to the script from the config)")
+    parser.add_argument('--output', help='Write the transcript to this file instead of stdout')
+    parser.add_argument('--no-echo', action='store_true', help='Do not echo prompts and commands')
+    parser.add_argument('--summary-json', help='Also write the timing summary to this file as JSON')
+    args = parser.parse_args(argv)
+
+    with open(args.config) as config_file:
+        config = json.load(config_file)
+    script = args.script or config.get('script') or '-'
+
+    processor = CommandProcessor.from_config(config)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        runner = BatchRunner(processor, out, echo=not args.no_echo)
+        if script == '-':
+            runner.run(sys.stdin)
+        else:
+            with open(script, 'r') as script_file:
+                runner.run(script_file)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    sys.stderr.write(runner.format_summary())
+    if args.summary_json:
+        with open(args.summary_json, 'w') as summary_file:
+            json.dump(runner.summary(), summary_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
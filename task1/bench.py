@@ -0,0 +1,185 @@
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+import vfs
+from batch import BatchRunner
+from main import CommandProcessor
+
+ROOT = 'fs'
+
+
+def build_tree(directories=50, files_per_directory=20, file_size=4096, depth=3, seed=0):
+    # path (relative to ROOT) -> bytes, or None for a directory
+    rng = random.Random(seed)
+    tree = {}
+    for number in range(directories):
+        parts = [f"d{number % (depth * 7) + level}" for level in range(depth - 1)] + [f"dir{number}"]
+        directory = "/".join(parts)
+        tree[directory] = None
+        for file_number in range(files_per_directory):
+            lines = []
+            size = 0
+            while size < file_size:
+                line = f"{directory}/file{file_number} line {len(lines)} value {rng.randrange(10 ** 6)}\n"
+                lines.append(line)
+                size += len(line)
+            tree[f"{directory}/file{file_number}.txt"] = "".join(lines).encode()[:file_size]
+    return tree
+
+
+def write_tar(tree, path, compression=''):
+    with tarfile.open(path, 'w:' + compression) as tar:
+        for name, content in tree.items():
+            info = tarfile.TarInfo(f"{ROOT}/{name}")
+            if content is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = len(content)
+                tar.addfile(info, fileobj=io.BytesIO(content))
+
+
+def write_zip(tree, path):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive_zip:
+        for name, content in tree.items():
+            if content is None:
+                archive_zip.writestr(f"{ROOT}/{name}/", b'')
+            else:
+                archive_zip.writestr(f"{ROOT}/{name}", content)
+
+
+def write_dir(tree, path):
+    for name, content in tree.items():
+        full_path = os.path.join(path, name)
+        if content is None:
+            os.makedirs(full_path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'wb') as output:
+                output.write(content)
+
+
+def prepare_backends(tree, workdir, names):
+    # backend name -> factory returning a freshly opened backend
+    factories = {}
+    for name in names:
+        if name == 'tar':
+            path = os.path.join(workdir, ROOT + '.tar')
+            write_tar(tree, path)
+            factories[name] = lambda path=path: vfs.TarBackend(path)
+        elif name == 'tar.gz':
+            path = os.path.join(workdir, ROOT + '.tar.gz')
+            write_tar(tree, path, 'gz')
+            factories[name] = lambda path=path: vfs.TarBackend(path)
+        elif name == 'zip':
+            path = os.path.join(workdir, ROOT + '.zip')
+            write_zip(tree, path)
+            factories[name] = lambda path=path: vfs.ZipBackend(path)
+        elif name == 'dir':
+            path = os.path.join(workdir, 'dir', ROOT)
+            write_dir(tree, path)
+            factories[name] = lambda path=path: vfs.DirBackend(path)
+        elif name == 'memory':
+            factories[name] = lambda: vfs.MemoryBackend(tree, ROOT)
+        else:
+            raise ValueError(f"Unknown backend: {name}")
+    return factories
+
+
+def build_scripts(tree, commands=200, seed=0):
+    rng = random.Random(seed)
+    directories = sorted(name for name, content in tree.items() if content is None)
+    files = sorted(name for name, content in tree.items() if content is not None)
+
+    # Paths are relative to the root, and every script starts and ends there
+    navigate = []
+    for directory in rng.choices(directories, k=commands // 2):
+        navigate += [f"cd {directory}", "ls", "cd " + "/".join([".."] * (directory.count('/') + 1))]
+
+    read = [f"cat {name}" for name in rng.choices(files, k=commands)]
+    paged = [f"tail -n 5 {name}" for name in rng.choices(files, k=commands)]
+    search = ["find -name '*.txt'", "find -type d", "grep -r 'value 12345' ."]
+    mutate = [f"rmdir {directory}" for directory in rng.sample(directories, min(len(directories), 10))]
+    mutate.append("sync")
+
+    # Mutations go last so the other scripts see the same tree on every backend
+    return {"navigate": navigate, "read": read, "paged": paged, "search": search, "mutate": mutate}
+
+
+def run_script(factory, commands):
+    started = time.perf_counter()
+    processor = CommandProcessor('bench', 'bench', backend=factory())
+    startup = time.perf_counter() - started
+    with open(os.devnull, 'w') as devnull:
+        runner = BatchRunner(processor, devnull, echo=False)
+        runner.run(commands)
+    summary = runner.summary()
+    return {
+        "startup_seconds": startup,
+        "total_seconds": summary["total_seconds"],
+        "commands": summary["commands"],
+        "commands_per_second": summary["commands_per_second"],
+        "p50_ms": summary["latency_ms"]["p50"],
+        "p95_ms": summary["latency_ms"]["p95"],
+    }
+
+
+def run_benchmark(directories=50, files_per_directory=20, file_size=4096, depth=3,
+                  backends=('tar', 'tar.gz', 'zip', 'dir', 'memory'), commands=200, seed=0):
+    tree = build_tree(directories, files_per_directory, file_size, depth, seed)
+    scripts = build_scripts(tree, commands, seed)
+    workdir = tempfile.mkdtemp(prefix='emulator-bench-')
+    results = []
+    try:
+        factories = prepare_backends(tree, workdir, backends)
+        for backend, factory in factories.items():
+            for script, script_commands in scripts.items():
+                result = run_script(factory, script_commands)
+                result.update(backend=backend, script=script)
+                results.append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def format_results(results):
+    lines = [f"{'backend':<8} {'script':<9} {'startup s':>10} {'total s':>9} {'cmd/s':>10} {'p50 ms':>8} {'p95 ms':>8}"]
+    for result in results:
+        lines.append(
+            f"{result['backend']:<8} {result['script']:<9} {result['startup_seconds']:>10.4f} "
+            f"{result['total_seconds']:>9.4f} {result['commands_per_second']:>10.1f} "
+            f"{result['p50_ms']:>8.3f} {result['p95_ms']:>8.3f}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the same command scripts against every storage backend')
+    parser.add_argument('--directories', type=int, default=50, help='Number of leaf directories')
+    parser.add_argument('--files', type=int, default=20, help='Files per directory')
+    parser.add_argument('--file-size', type=int, default=4096, help='Size of each file in bytes')
+    parser.add_argument('--depth', type=int, default=3, help='Directory depth')
+    parser.add_argument('--commands', type=int, default=200, help='Commands per script')
+    parser.add_argument('--backends', default='tar,tar.gz,zip,dir,memory', help='Comma-separated backends to run')
+    parser.add_argument('--json', help='Write results to this file as JSON')
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.directories, args.files, args.file_size, args.depth,
+                            args.backends.split(','), args.commands)
+    sys.stdout.write(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
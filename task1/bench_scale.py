@@ -0,0 +1,264 @@
+import argparse
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import time
+import archive
+from batch import BatchRunner
+from main import CommandProcessor
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then left out of the results
+    resource = None
+
+FILES_PER_DIRECTORY = 50
+
+
+def directory_name(number, depth, fanout):
+    parts = []
+    for level in range(depth):
+        number, digit = divmod(number, fanout)
+        parts.append(f"d{level}_{digit}")
+    return "/".join(reversed(parts))
+
+
+def layout(members, depth):
+    # Spreads `members` entries over directories `depth` levels deep
+    directories = max(1, members // (FILES_PER_DIRECTORY + 1))
+    fanout = max(2, math.ceil(directories ** (1 / depth))) if depth > 0 else 1
+    return directories, fanout
+
+
+def iter_members(members, depth, file_sizes):
+    # Yields (name, size or None for a directory), parents before children
+    directories, fanout = layout(members, depth)
+    seen = set()
+    produced = 0
+    number = 0
+    while produced < members:
+        directory = directory_name(number % directories, depth, fanout) if depth > 0 else ""
+        parts = directory.split("/") if directory else []
+        for level in range(1, len(parts) + 1):
+            parent = "/".join(parts[:level])
+            if parent not in seen and produced < members:
+                seen.add(parent)
+                produced += 1
+                yield parent, None
+        for file_number in range(FILES_PER_DIRECTORY):
+            if produced >= members:
+                break
+            name = f"{directory}/f{number}_{file_number}.txt" if directory else f"f{number}_{file_number}.txt"
+            yield name, file_sizes[(number + file_number) % len(file_sizes)]
+            produced += 1
+        number += 1
+
+
+def generate_archive(path, members, depth, file_sizes):
+    # Members live under the directory the emulator derives from the file name
+    root = archive.root_name(path)
+    contents = {}
+    with tarfile.open(path, 'w') as tar:
+        for name, size in iter_members(members, depth, file_sizes):
+            info = tarfile.TarInfo(f"{root}/{name}")
+            if size is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+                continue
+            if size not in contents:
+                contents[size] = (b"lorem ipsum dolor sit amet\n" * (size // 27 + 1))[:size]
+            info.size = size
+            tar.addfile(info, fileobj=io.BytesIO(contents[size]))
+
+
+def archive_path(workdir, members, depth, file_sizes):
+    sizes = "-".join(str(size) for size in file_sizes)
+    return os.path.join(workdir, f"fs{members}-d{depth}-s{sizes}.tar")
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def peak_memory_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_case(path, repeat=20, script_commands=500, seed=0):
+    # Times every operation against one archive. Cold startup removes the sidecar first.
+    for suffix in ('.idx', '.journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    rng = random.Random(seed)
+
+    started = time.perf_counter()
+    processor = CommandProcessor('bench', 'bench', path)
+    cold_startup = time.perf_counter() - started
+    processor.exit()
+
+    started = time.perf_counter()
+    processor = CommandProcessor('bench', 'bench', path)
+    warm_startup = time.perf_counter() - started
+
+    index = processor.image.index
+    directories = sorted(name for name in index.children if name != processor.current_dir)
+    files = [name for name, member in index.entries.items() if member is not None and member.isfile()]
+    root_prefix = processor.current_dir + '/'
+    sample_directories = [name[len(root_prefix):] for name in rng.choices(directories or [processor.current_dir], k=repeat)]
+    sample_files = [name[len(root_prefix):] for name in rng.choices(files, k=repeat)] if files else []
+
+    def cd_round_trip():
+        for directory in sample_directories:
+            processor.cd(directory)
+            processor.current_dir = processor.filename_without_extension
+
+    def ls_directories():
+        for directory in sample_directories:
+            processor.ls(directory)
+
+    def cat_files():
+        for name in sample_files:
+            processor.cat(name)
+
+    cd_time = timed(cd_round_trip, 1) / max(len(sample_directories), 1)
+    ls_time = timed(ls_directories, 1) / max(len(sample_directories), 1)
+    cat_time = timed(cat_files, 1) / max(len(sample_files), 1)
+
+    removable = [name for name in sample_directories if name and '/' not in name] or sample_directories[:1]
+    started = time.perf_counter()
+    removed = 0
+    for name in dict.fromkeys(removable):
+        if processor.isdir(processor.resolve_path(name)):
+            processor.rmdir(name)
+            removed += 1
+    rmdir_time = (time.perf_counter() - started) / max(removed, 1)
+    started = time.perf_counter()
+    processor.sync()
+    sync_time = time.perf_counter() - started
+    processor.exit()
+
+    # A mixed script through the headless runner, on the compacted archive
+    processor = CommandProcessor('bench', 'bench', path)
+    remaining = [name for name, member in processor.image.index.entries.items() if member is not None and member.isfile()]
+    script = []
+    for name in rng.choices(remaining or [root_prefix], k=script_commands // 3):
+        relative = name[len(root_prefix):]
+        directory = relative.rpartition('/')[0]
+        script += [f"cd {directory}" if directory else "cd .", "ls", f"cat {relative.rpartition('/')[2]}"]
+        script.append("cd " + "/".join([".."] * (directory.count('/') + 1)) if directory else "cd .")
+    with open(os.devnull, 'w') as devnull:
+        runner = BatchRunner(processor, devnull, echo=False)
+        runner.run(script)
+    summary = runner.summary()
+
+    return {
+        "archive_bytes": os.path.getsize(path),
+        "cold_startup_seconds": cold_startup,
+        "warm_startup_seconds": warm_startup,
+        "cd_seconds": cd_time,
+        "ls_seconds": ls_time,
+        "cat_seconds": cat_time,
+        "rmdir_seconds": rmdir_time,
+        "sync_seconds": sync_time,
+        "script_commands": summary["commands"],
+        "script_seconds": summary["total_seconds"],
+        "script_commands_per_second": summary["commands_per_second"],
+        "script_p95_ms": summary["latency_ms"]["p95"],
+        "peak_memory_kb": peak_memory_kb(),
+    }
+
+
+def run_suite(workdir, member_counts, depths, file_sizes, repeat=20, script_commands=500, isolate=True):
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    for members in member_counts:
+        for depth in depths:
+            # The archive is rewritten by rmdir/sync, so every case starts from a fresh copy
+            path = archive_path(workdir, members, depth, file_sizes)
+            started = time.perf_counter()
+            generate_archive(path, members, depth, file_sizes)
+            generate_seconds = time.perf_counter() - started
+
+            if isolate:
+                # A separate process per case keeps peak memory figures independent
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--case', path,
+                     '--repeat', str(repeat), '--script-commands', str(script_commands)],
+                    capture_output=True, text=True, check=True
+                )
+                result = json.loads(completed.stdout)
+            else:
+                result = run_case(path, repeat, script_commands)
+            result.update(members=members, depth=depth, file_sizes=list(file_sizes),
+                          generate_seconds=generate_seconds)
+            results.append(result)
+            os.remove(path)
+            for suffix in ('.idx', '.journal'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+    return results
+
+
+def format_results(results):
+    lines = [f"{'members':>9} {'depth':>5} {'cold s':>8} {'warm s':>8} {'cd ms':>7} {'ls ms':>7} "
+             f"{'cat ms':>7} {'rmdir ms':>8} {'sync s':>7} {'cmd/s':>9} {'peak MB':>8}"]
+    for result in results:
+        peak = result["peak_memory_kb"]
+        lines.append(
+            f"{result['members']:>9} {result['depth']:>5} {result['cold_startup_seconds']:>8.3f} "
+            f"{result['warm_startup_seconds']:>8.3f} {result['cd_seconds'] * 1000:>7.3f} "
+            f"{result['ls_seconds'] * 1000:>7.3f} {result['cat_seconds'] * 1000:>7.3f} "
+            f"{result['rmdir_seconds'] * 1000:>8.3f} {result['sync_seconds']:>7.3f} "
+            f"{result['script_commands_per_second']:>9.0f} "
+            f"{(peak / 1024 if peak is not None else float('nan')):>8.1f}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def parse_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure how the emulator scales with archive size')
+    parser.add_argument('--members', type=parse_list, default=[1000, 10000, 100000, 1000000],
+                        help='Comma-separated member counts')
+    parser.add_argument('--depths', type=parse_list, default=[2, 6], help='Comma-separated directory depths')
+    parser.add_argument('--file-sizes', type=parse_list, default=[0, 512, 8192],
+                        help='Comma-separated file sizes, cycled over the files')
+    parser.add_argument('--repeat', type=int, default=20, help='Samples per timed operation')
+    parser.add_argument('--script-commands', type=int, default=500, help='Commands in the mixed script')
+    parser.add_argument('--workdir', default='bench_archives', help='Where generated archives are written')
+    parser.add_argument('--json', help='Write results to this file as JSON')
+    parser.add_argument('--in-process', action='store_true', help='Run every case in this process')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        json.dump(run_case(args.case, args.repeat, args.script_commands), sys.stdout)
+        return 0
+
+    results = run_suite(args.workdir, args.members, args.depths, args.file_sizes,
+                        args.repeat, args.script_commands, isolate=not args.in_process)
+    sys.stdout.write(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+
+BLOCK_SIZE = 64 * 1024
+DEFAULT_CACHE_SIZE = 16 * 1024 * 1024
+
+
+class BlockCache:
+    # Size-bounded LRU cache of archive data blocks
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE, block_size=BLOCK_SIZE):
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.blocks = OrderedDict()
+
+    def get(self, key):
+        block = self.blocks.get(key)
+        if block is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.blocks.move_to_end(key)
+        return block
+
+    def put(self, key, block):
+        if len(block) > self.max_bytes:
+            return
+        previous = self.blocks.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self.blocks[key] = block
+        self.size += len(block)
+        while self.size > self.max_bytes:
+            _, evicted = self.blocks.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self):
+        self.blocks.clear()
+        self.size = 0
@@ -0,0 +1,407 @@
+import bisect
+import bz2
+import io
+import lzma
+import struct
+import zlib
+
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+READ_SIZE = 64 * 1024
+OUTPUT_SIZE = 64 * 1024
+CHECKPOINT_SPACING = 4 * 1024 * 1024
+# Uncompressed bytes per independent bz2/xz stream when writing an image
+STREAM_SIZE = 4 * 1024 * 1024
+
+
+class GzipCheckpointReader(io.RawIOBase):
+    # Seekable view of the uncompressed contents of a gzip file. While reading
+    # forward it snapshots the decompressor every `spacing` bytes, so a later
+    # seek only has to decompress from the nearest checkpoint before it.
+    magic = GZIP_MAGIC
+
+    def __init__(self, fileobj, spacing=CHECKPOINT_SPACING):
+        super().__init__()
+        self.fileobj = fileobj
+        self.spacing = spacing
+        self.position = 0
+        # uncompressed offsets, and (compressed offset, decompressor, pending input) at each
+        self.checkpoint_offsets = []
+        self.checkpoints = []
+        # Whether the decompressor has just been started on a new member
+        self._fresh = False
+        self._restore(0, 0, None, b'')
+
+    @property
+    def name(self):
+        return getattr(self.fileobj, 'name', None)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            while self._fill():
+                pass
+            position = self._offset + len(self._buffer) + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self.position = position
+        return position
+
+    def read(self, size=-1):
+        self._check_not_closed()
+        chunks = []
+        while size < 0 or size > 0:
+            chunk = self._read_buffered(size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.close()
+            self.checkpoints = []
+            self.checkpoint_offsets = []
+        super().close()
+
+    def _check_not_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+    def _read_buffered(self, size):
+        self._move_to(self.position)
+        while self.position >= self._offset + len(self._buffer):
+            if not self._fill():
+                return b''
+        start = self.position - self._offset
+        end = len(self._buffer) if size < 0 else start + size
+        chunk = self._buffer[start:end]
+        self.position += len(chunk)
+        return chunk
+
+    def _move_to(self, position):
+        buffer_end = self._offset + len(self._buffer)
+        if self._offset <= position < buffer_end + self.spacing:
+            return
+        index = bisect.bisect_right(self.checkpoint_offsets, position) - 1
+        if index < 0:
+            if position < self._offset:
+                self._restore(0, 0, None, b'')
+            return
+        offset = self.checkpoint_offsets[index]
+        if position < self._offset or offset > buffer_end:
+            compressed_offset, decompressor, pending = self.checkpoints[index]
+            self._restore(offset, compressed_offset, decompressor.copy() if decompressor is not None else None, pending)
+
+    def _restore(self, offset, compressed_offset, decompressor, pending):
+        self._offset = offset
+        self._buffer = b''
+        self._compressed_offset = compressed_offset
+        self._decompressor = decompressor
+        self._pending = pending
+
+    def _new_decompressor(self):
+        return zlib.decompressobj(GZIP_WBITS)
+
+    def _snapshot(self):
+        return self._decompressor.copy()
+
+    def _needs_input(self):
+        return True
+
+    def _decompress(self):
+        self._buffer = self._decompressor.decompress(self._pending, OUTPUT_SIZE)
+        if self._decompressor.eof:
+            self._pending = self._decompressor.unused_data
+            self._decompressor = None
+        else:
+            self._pending = self._decompressor.unconsumed_tail
+
+    def _checkpoint(self):
+        offset = self._offset
+        last = self.checkpoint_offsets[-1] if self.checkpoint_offsets else 0
+        if self._decompressor is None or offset < last + self.spacing:
+            return
+        if self.checkpoint_offsets and offset <= last:
+            return
+        snapshot = self._snapshot()
+        if snapshot is False:
+            return
+        self.checkpoint_offsets.append(offset)
+        self.checkpoints.append((self._compressed_offset, snapshot, self._pending))
+
+    def _fill(self):
+        # Replaces the buffer with the next run of decompressed bytes
+        self._offset += len(self._buffer)
+        self._buffer = b''
+        while not self._buffer:
+            if not self._pending and (self._decompressor is None or self._needs_input()):
+                self.fileobj.seek(self._compressed_offset)
+                self._pending = self.fileobj.read(READ_SIZE)
+                self._compressed_offset += len(self._pending)
+                if not self._pending:
+                    return False
+
+            if self._decompressor is None:
+                # Concatenated members continue the stream; anything else is trailing padding
+                if len(self._pending) < len(self.magic) and self._read_more():
+                    continue
+                if not self._pending.startswith(self.magic):
+                    self._pending = b''
+                    return False
+                self._decompressor = self._new_decompressor()
+                self._fresh = True
+
+            self._checkpoint()
+            self._decompress()
+            self._fresh = False
+        return True
+
+    def _read_more(self):
+        self.fileobj.seek(self._compressed_offset)
+        more = self.fileobj.read(READ_SIZE)
+        self._compressed_offset += len(more)
+        self._pending += more
+        return bool(more)
+
+
+class Bz2CheckpointReader(GzipCheckpointReader):
+    # A bz2 decompressor can't be copied, so checkpoints are only taken where a
+    # new stream starts and a fresh decompressor can take over. Images written
+    # by ChunkedStreamWriter start a stream every STREAM_SIZE bytes; a file
+    # made of one stream still has to be decompressed from the start.
+    magic = b'BZh'
+
+    def __init__(self, fileobj, spacing=0):
+        super().__init__(fileobj, spacing)
+
+    def _new_decompressor(self):
+        return bz2.BZ2Decompressor()
+
+    def _snapshot(self):
+        return None if self._fresh else False
+
+    def _needs_input(self):
+        return self._decompressor.needs_input
+
+    def _decompress(self):
+        # Input the decompressor holds back under OUTPUT_SIZE stays inside it
+        self._buffer = self._decompressor.decompress(self._pending, OUTPUT_SIZE)
+        if self._decompressor.eof:
+            self._pending = self._decompressor.unused_data
+            self._decompressor = None
+        else:
+            self._pending = b''
+
+
+def read_multibyte(data, position):
+    # xz variable-length integer: seven bits per byte, least significant first
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def xz_blocks(fileobj):
+    # (uncompressed offset, uncompressed size, compressed offset, compressed size,
+    # stream header) of every block, read from the stream indexes at the end of
+    # each stream without decompressing anything
+    fileobj.seek(0, io.SEEK_END)
+    end = fileobj.tell()
+    streams = []
+    while end > 0:
+        fileobj.seek(end - 4)
+        if fileobj.read(4) == b'\0\0\0\0':
+            # Stream padding between concatenated streams
+            end -= 4
+            continue
+        fileobj.seek(end - 12)
+        footer = fileobj.read(12)
+        if len(footer) < 12 or footer[10:12] != b'YZ':
+            raise lzma.LZMAError("xz stream footer not found")
+        index_size = (struct.unpack('<I', footer[4:8])[0] + 1) * 4
+        index_start = end - 12 - index_size
+        fileobj.seek(index_start)
+        index = fileobj.read(index_size)
+        if not index or index[0] != 0:
+            raise lzma.LZMAError("xz index not found")
+        count, position = read_multibyte(index, 1)
+        records = []
+        for _ in range(count):
+            unpadded, position = read_multibyte(index, position)
+            uncompressed, position = read_multibyte(index, position)
+            records.append(((unpadded + 3) & ~3, uncompressed))
+        stream_start = index_start - sum(size for size, _ in records) - 12
+        fileobj.seek(stream_start)
+        header = fileobj.read(12)
+        if stream_start < 0 or not header.startswith(b'\xfd7zXZ\x00'):
+            raise lzma.LZMAError("xz stream header not found")
+        streams.append((stream_start, header, records))
+        end = stream_start
+
+    blocks = []
+    uncompressed_offset = 0
+    for stream_start, header, records in reversed(streams):
+        compressed_offset = stream_start + 12
+        for size, uncompressed in records:
+            blocks.append((uncompressed_offset, uncompressed, compressed_offset, size, header))
+            uncompressed_offset += uncompressed
+            compressed_offset += size
+    return blocks
+
+
+class XzBlockReader(io.RawIOBase):
+    # Seekable view of the uncompressed contents of an xz file. Every block is
+    # compressed on its own and the indexes say where each one starts, so a
+    # seek only decompresses the block it lands in: the block is fed to a fresh
+    # decompressor behind its stream's header.
+    def __init__(self, fileobj):
+        super().__init__()
+        self.fileobj = fileobj
+        self.blocks = xz_blocks(fileobj)
+        self.block_offsets = [block[0] for block in self.blocks]
+        self.size = sum(block[1] for block in self.blocks)
+        self.position = 0
+        self._block = None
+
+    @property
+    def name(self):
+        return getattr(self.fileobj, 'name', None)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self.position = position
+        return position
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        chunks = []
+        while (size < 0 or size > 0) and self.position < self.size:
+            self._move_to(self.position)
+            while self.position >= self._offset + len(self._buffer):
+                self._fill()
+            start = self.position - self._offset
+            end = len(self._buffer) if size < 0 else start + size
+            chunk = self._buffer[start:end]
+            chunks.append(chunk)
+            self.position += len(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.close()
+        super().close()
+
+    def _move_to(self, position):
+        index = bisect.bisect_right(self.block_offsets, position) - 1
+        if index == self._block and self._offset <= position:
+            return
+        uncompressed_offset, _, compressed_offset, _, header = self.blocks[index]
+        self._block = index
+        self._offset = uncompressed_offset
+        self._buffer = b''
+        self._compressed_offset = compressed_offset
+        self._decompressor = lzma.LZMADecompressor(lzma.FORMAT_XZ)
+        self._decompressor.decompress(header)
+
+    def _fill(self):
+        # Replaces the buffer with the next run of the current block's bytes
+        uncompressed_offset, uncompressed, compressed_offset, size, _ = self.blocks[self._block]
+        self._offset += len(self._buffer)
+        self._buffer = b''
+        while not self._buffer:
+            data = b''
+            if self._decompressor.needs_input:
+                remaining = compressed_offset + size - self._compressed_offset
+                if remaining <= 0:
+                    raise lzma.LZMAError("xz block ended early")
+                self.fileobj.seek(self._compressed_offset)
+                data = self.fileobj.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise lzma.LZMAError("unexpected end of xz file")
+                self._compressed_offset += len(data)
+            self._buffer = self._decompressor.decompress(data, OUTPUT_SIZE)
+        self._buffer = self._buffer[:uncompressed_offset + uncompressed - self._offset]
+
+
+class ChunkedStreamWriter:
+    # Compresses into a new, independent stream every `size` uncompressed
+    # bytes. Concatenated streams are a valid bz2 or xz file for any reader,
+    # and let Bz2CheckpointReader and XzBlockReader start reading mid-file.
+    def __init__(self, raw, new_compressor, size=STREAM_SIZE):
+        self.raw = raw
+        self.new_compressor = new_compressor
+        self.size = size
+        self.compressor = new_compressor()
+        self.written = 0
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.size - self.written)
+            self.raw.write(self.compressor.compress(view[:take]))
+            self.written += take
+            view = view[take:]
+            if self.written == self.size:
+                self.raw.write(self.compressor.flush())
+                self.compressor = self.new_compressor()
+                self.written = 0
+        return len(data)
+
+    def close(self):
+        if self.compressor is not None:
+            if self.written:
+                self.raw.write(self.compressor.flush())
+            self.compressor = None
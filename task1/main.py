@@ -5,115 +5,565 @@ import tkinter as tk
 from tkinter import scrolledtext
 import platform
 import subprocess
-import os
+import bisect
+import fnmatch
+import queue
+import threading
+import codecs
+import archive
+import vfs
+from overlay import Overlay
+from cache import BlockCache, DEFAULT_CACHE_SIZE
+import search
+import pipeline
+
+class DirectoryIndex:
+    def __init__(self):
+        # normalized path -> TarInfo (None for directories implied by their children)
+        self.entries = {}
+        # directory path -> sorted list of child names
+        self.children = {}
+
+    @classmethod
+    def from_members(cls, members):
+        index = cls()
+        for member in members:
+            path = member.name.rstrip('/')
+            if not path:
+                continue
+            index._register(path, member)
+        for names in index.children.values():
+            names.sort()
+        return index
+
+    def _register(self, path, member):
+        if path in self.entries:
+            # Later members override earlier ones, as tarfile.getmember does
+            if member is not None:
+                self.entries[path] = member
+            return
+        self.entries[path] = member
+        if member is None or member.isdir():
+            self.children.setdefault(path, [])
+        parent, _, name = path.rpartition('/')
+        if parent:
+            if parent not in self.entries:
+                self._register(parent, None)
+            self.children.setdefault(parent, []).append(name)
+
+    def get(self, path):
+        return self.entries.get(path)
+
+    def isdir(self, path):
+        return path in self.children
+
+    def list(self, path):
+        return self.children.get(path, [])
+
+    def walk(self, path):
+        # Yields path and everything below it, parents before children
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            yield current
+            for name in reversed(self.children.get(current, [])):
+                stack.append(current + '/' + name)
+
+    def remove(self, path):
+        if path not in self.entries:
+            return []
+        removed = list(self.walk(path))
+        for current in removed:
+            del self.entries[current]
+            self.children.pop(current, None)
+        parent, _, name = path.rpartition('/')
+        if parent in self.children:
+            names = self.children[parent]
+            position = bisect.bisect_left(names, name)
+            if position < len(names) and names[position] == name:
+                del names[position]
+        return removed
+
+# Shell command name -> CommandProcessor method taking (args, stdin). stdin is
+# the previous pipeline stage's output as a generator of text chunks, or None.
+COMMANDS = {}
+
+
+def command(name):
+    def register(method):
+        COMMANDS[name] = method
+        return method
+    return register
+
+
+class ArchiveImage:
+    # Image state that several sessions can share: the storage backend, the
+    # member index and the block cache. Sessions keep their changes in
+    # overlays; only compact writes them back through the backend.
+    def __init__(self, path=None, cache_size=DEFAULT_CACHE_SIZE, backend=None):
+        self.backend = backend if backend is not None else vfs.open_backend(path)
+        self.path = self.backend.path
+        self.root = self.backend.root
+
+        # Index the members once
+        self.index = DirectoryIndex.from_members(self.backend.entries())
+
+        # Recently read data blocks, keyed by member name and block number
+        self.cache = BlockCache(cache_size)
+        # Seeking and reading the shared backend must not interleave
+        self.lock = threading.RLock()
+
+    @property
+    def closed(self):
+        return self.backend.closed
+
+    def read_block(self, member, block):
+        key = (member.name, block)
+        with self.lock:
+            data = self.cache.get(key)
+            if data is None:
+                start = block * self.cache.block_size
+                data = self.backend.read(member, start, min(self.cache.block_size, member.size - start))
+                self.cache.put(key, data)
+        return data
+
+    def iter_data(self, member, chunk_size=archive.COPY_BUFSIZE):
+        # Uncached read of a member's data, for scans that would only flush the cache
+        position = 0
+        while position < member.size:
+            with self.lock:
+                chunk = self.backend.read(member, position, min(chunk_size, member.size - position))
+            if not chunk:
+                break
+            yield chunk
+            position += len(chunk)
+
+    def compact(self, overlay):
+        # Writes everything the overlay removed back to the image
+        removed = list(overlay.removed)
+        with self.lock:
+            self.backend.compact(overlay)
+            self.cache.clear()
+            for path in removed:
+                self.index.remove(path)
+
+    def close(self):
+        self.backend.close()
+
 
 class CommandProcessor:
-    def __init__(self, user_name, computer_name, path):
+    def __init__(self, user_name, computer_name, path=None, cache_size=DEFAULT_CACHE_SIZE, image=None,
+                 grep_workers=0, backend=None):
         self.user_name = user_name
         self.computer_name = computer_name
-        self.path = path
+        self.grep_workers = grep_workers
 
-        self.filename_without_extension = os.path.splitext(os.path.basename(self.path))[0]
+        # A session handed an image shares it read-only: its changes stay in
+        # its own overlay and are never written back
+        self.shared = image is not None
+        self.image = image if self.shared else ArchiveImage(path, cache_size, backend)
+        self.path = self.image.path
+        self.filename_without_extension = self.image.root
 
-        # Open the tarfile
-        self.tar = tarfile.open(self.path, 'r')
+        # Mutations stay in the overlay until sync or exit compacts them into
+        # the archive; the journal lets them survive a crash in between
+        journal_path = None if self.shared or self.path is None else self.path + '.journal'
+        self.overlay = Overlay(journal_path)
+        self.overlay.replay()
 
         # Set the root folder
         self.current_dir = self.filename_without_extension
 
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['user_name'],
+            config['computer_name'],
+            config['path'],
+            config.get('cache_size', DEFAULT_CACHE_SIZE),
+            grep_workers=config.get('grep_workers', 0)
+        )
+
+    def resolve_path(self, path):
+        full_path = os.path.normpath(os.path.join(self.current_dir, path))
+        return full_path.replace("\\", "/")  # Ensure consistent path format
+
+    def isdir(self, path):
+        return self.image.index.isdir(path) and not self.overlay.is_removed(path)
+
+    def get_member(self, path):
+        if self.overlay.is_removed(path):
+            return None
+        return self.image.index.get(path)
+
+    def list_dir(self, path):
+        prefix = path + '/'
+        return [name for name in self.image.index.list(path) if prefix + name not in self.overlay.removed]
+
+    def walk(self, path):
+        # Index walk that skips whatever the overlay removed
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            yield current
+            prefix = current + '/'
+            for name in reversed(self.image.index.list(current)):
+                if prefix + name not in self.overlay.removed:
+                    stack.append(prefix + name)
+
     def cd(self, path):
-        new_dir = os.path.normpath(os.path.join(self.current_dir, path))
-        new_dir = new_dir.replace("\\", "/")  # Ensure consistent path format
-        if any(member.name.rstrip('/') == new_dir and member.isdir() for member in self.tar.getmembers()):
+        new_dir = self.resolve_path(path)
+        if self.isdir(new_dir):
             self.current_dir = new_dir
             return ""
         else:
             return "cd: no such file or directory\n"
 
-    def ls(self):
+    def ls_lines(self, path=None):
+        directory = self.current_dir if not path else self.resolve_path(path)
+        if not self.isdir(directory):
+            yield f"ls: cannot access '{path or '.'}': No such directory\n"
+            return
         try:
-            current_dir_prefix = self.current_dir.rstrip('/') + '/'
-            files = [
-                member.name[len(current_dir_prefix):].split('/')[0]
-                for member in self.tar.getmembers()
-                if member.name.startswith(current_dir_prefix) and member.name != current_dir_prefix
-            ]
-            return "\n".join(sorted(set(files))) + "\n"
+            names = self.list_dir(directory)
         except Exception as e:
-            return f"Error: {str(e)}\n"
+            yield f"Error: {str(e)}\n"
+            return
+        if not names:
+            yield "\n"
+        for name in names:
+            yield name + "\n"
+
+    def ls(self, path=None):
+        return "".join(self.ls_lines(path))
+
+    def iter_bytes(self, member, start=0, end=None):
+        end = member.size if end is None else min(end, member.size)
+        position = max(start, 0)
+        while position < end:
+            block, skip = divmod(position, self.image.cache.block_size)
+            data = self.image.read_block(member, block)
+            chunk = data[skip:skip + end - position]
+            if not chunk:
+                break
+            yield chunk
+            position += len(chunk)
+
+    def iter_text(self, member, start=0, end=None):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for chunk in self.iter_bytes(member, start, end):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text
+
+    def _get_file(self, file_path):
+        member = self.get_member(self.resolve_path(file_path))
+        if member is not None and member.isfile():
+            return member
+        return None
+
+    def cat_chunks(self, file_path, start=0, end=None):
+        member = self._get_file(file_path)
+        if member is None:
+            yield f"cat: {file_path}: No such file\n"
+            return
+        yield from self.iter_text(member, start, end)
+        yield "\n"
 
     def cat(self, file_path):
-        full_path = os.path.normpath(os.path.join(self.current_dir, file_path))
-        full_path = full_path.replace("\\", "/")  # Ensure consistent path format
+        return "".join(self.cat_chunks(file_path))
+
+    def _parse_count(self, args):
+        # [-n LINES | -c BYTES] [FILE]
+        parts = args.split()
+        unit, count = 'n', 10
+        if len(parts) >= 2 and parts[0] in ('-n', '-c') and parts[1].isdigit():
+            unit, count = parts[0][1], int(parts[1])
+            parts = parts[2:]
+        return unit, count, parts
+
+    def _parse_range_args(self, name, args):
+        unit, count, parts = self._parse_count(args)
+        if len(parts) != 1:
+            return None, f"{name}: usage: {name} [-n LINES | -c BYTES] FILE\n"
+        member = self._get_file(parts[0])
+        if member is None:
+            return None, f"{name}: {parts[0]}: No such file\n"
+        return (member, unit, count), None
+
+    def _line_start(self, member, count):
+        # Walks blocks backwards from the end until `count` line breaks are found
+        if count == 0:
+            return member.size
+        remaining = count
+        block_size = self.image.cache.block_size
+        last_block = (member.size - 1) // block_size
+        for block in range(last_block, -1, -1):
+            data = self.image.read_block(member, block)
+            end = len(data)
+            if block == last_block and data.endswith(b"\n"):
+                end -= 1
+            while True:
+                position = data.rfind(b"\n", 0, end)
+                if position < 0:
+                    break
+                remaining -= 1
+                if remaining == 0:
+                    return block * block_size + position + 1
+                end = position
+        return 0
+
+    def head(self, args):
+        parsed, error = self._parse_range_args("head", args)
+        if error:
+            return error
+        member, unit, count = parsed
+        if unit == 'c':
+            end = count
+        else:
+            end = 0
+            remaining = count
+            for chunk in self.iter_bytes(member):
+                position = -1
+                while remaining > 0:
+                    position = chunk.find(b"\n", position + 1)
+                    if position < 0:
+                        break
+                    remaining -= 1
+                if remaining == 0:
+                    end += position + 1
+                    break
+                end += len(chunk)
+        return self._terminate("".join(self.iter_text(member, 0, end)))
+
+    def tail(self, args):
+        parsed, error = self._parse_range_args("tail", args)
+        if error:
+            return error
+        member, unit, count = parsed
+        if unit == 'c':
+            start = member.size - count
+        else:
+            start = self._line_start(member, count)
+        return self._terminate("".join(self.iter_text(member, start)))
+
+    def _terminate(self, text):
+        return text if not text or text.endswith("\n") else text + "\n"
+
+    def find_lines(self, args):
+        # One line per match, as the walk finds it
         try:
-            member = self.tar.getmember(full_path)
-            if member.isfile():
-                file = self.tar.extractfile(member)
-                return file.read().decode() + "\n"
-            else:
-                return f"cat: {file_path}: No such file\n"
-        except KeyError:
-            return f"cat: {file_path}: No such file\n"
+            options = search.parse_find_args(args)
+        except ValueError as e:
+            yield f"{str(e)}\n"
+            return
+
+        start = self.resolve_path(options["path"])
+        if self.get_member(start) is None and not self.isdir(start):
+            yield f"find: '{options['path']}': No such file or directory\n"
+            return
+
+        for path in self.walk(start):
+            if options["type"] == 'd' and not self.image.index.isdir(path):
+                continue
+            if options["type"] == 'f' and self.image.index.isdir(path):
+                continue
+            if options["name"] and not fnmatch.fnmatchcase(path.rpartition('/')[2], options["name"]):
+                continue
+            yield options["path"].rstrip('/') + path[len(start):] + "\n"
+
+    def find(self, args):
+        return "".join(self.find_lines(args))
+
+    def grep(self, args, stdin=None):
+        try:
+            options = search.parse_grep_args(args)
+        except ValueError as e:
+            yield f"{str(e)}\n"
+            return
+
+        if options["path"] is None and stdin is not None:
+            yield from pipeline.grep_chunks(stdin, options["regex"])
+            return
+        options["path"] = options["path"] or "."
+
+        start = self.resolve_path(options["path"])
+        if self.isdir(start):
+            if not options["recursive"]:
+                yield f"grep: {options['path']}: Is a directory\n"
+                return
+            files = [(path, self.image.index.get(path)) for path in self.walk(start)]
+            files = [(path, member) for path, member in files if member is not None and member.isfile()]
+            show_name = True
+        else:
+            member = self.get_member(start)
+            if member is None or not member.isfile():
+                yield f"grep: {options['path']}: No such file or directory\n"
+                return
+            files = [(start, member)]
+            show_name = False
+
+        # Visit files in archive order so the whole search is one forward pass
+        files.sort(key=lambda item: item[1].offset_data)
+        prefix = options["path"].rstrip('/')
+
+        def pieces():
+            for path, member in files:
+                name = prefix + path[len(start):]
+                yield from search.line_pieces(name, self.image.iter_data(member))
+
+        workers = options["workers"] if options["workers"] is not None else self.grep_workers
+        yield from search.grep_pieces(pieces(), options["regex"], show_name, workers)
 
     def uname(self):
         return platform.system() + "\n"
 
 
     def rmdir(self, dir_path):
-        full_path = os.path.normpath(os.path.join(self.current_dir, dir_path))
-        full_path = full_path.replace("\\", "/")
-        self_path = self.path.replace("\\", "/")
-        
+        full_path = self.resolve_path(dir_path)
+
         # Check if directory exists in the archive
+        if not self.isdir(full_path):
+            return f"rmdir: {dir_path}: No such directory\n"
+        # The image root holds the whole archive
+        if full_path == self.filename_without_extension:
+            return f"rmdir: {dir_path}: Cannot remove the root directory\n"
+
         try:
-            dir_exists = False
-            for member in self.tar.getmembers():
-                if member.name.startswith(full_path) and member.isdir():
-                    dir_exists = True
-                    break
-                    
-            if not dir_exists:
-                return f"rmdir: {dir_path}: No such directory\n"
-                
-            # Close the tar archive
-            self.tar.close()
-            
-            # Use 7z to delete the directory from the archive  
-            command = f'7z d "{self_path}" "{full_path}"'
-            result = os.system(command)
-            
-            # Reopen the tar archive
-            self.tar = tarfile.open(self.path, 'r')
-            
-            if result == 0:
-                return f"Directory {dir_path} removed successfully\n"
-            else:
-                return f"Error removing directory {dir_path}\n"
-                
-        except Exception as e:
-            return f"Error: {str(e)}\n"
+            self.overlay.rmdir(full_path)
+        except OSError:
+            return f"Error removing directory {dir_path}\n"
 
-    def exit(self):
-        self.tar.close()
+        if archive.in_subtree(self.current_dir, full_path):
+            self.current_dir = full_path.rpartition('/')[0] or self.filename_without_extension
+        return f"Directory {dir_path} removed successfully\n"
+
+    def sync(self):
+        if self.shared:
+            return "sync: archive is shared read-only\n"
+        if not self.overlay:
+            return ""
+
+        try:
+            self.image.compact(self.overlay)
+        except (OSError, tarfile.TarError) as e:
+            return f"sync: {str(e)}\n"
+        self.overlay.clear()
         return ""
 
+    def exit(self):
+        output = ""
+        if not self.shared and not self.image.closed:
+            output = self.sync()
+            self.image.close()
+        self.overlay.close()
+        return output
+
+    def run(self, command):
+        # Yields the output of one command line in chunks. Pipeline stages are
+        # chained generators, so upstream stages only produce what downstream pulls.
+        stream = None
+        for stage in pipeline.split_pipeline(command):
+            name, _, args = stage.partition(" ")
+            handler = COMMANDS.get(name)
+            if handler is None:
+                if stream is not None:
+                    stream.close()
+                yield f"Unknown command: {stage}\n"
+                return
+            stream = handler(self, args.strip(), stream)
+        yield from stream
+
+    @command("cd")
+    def run_cd(self, args, stdin):
+        yield self.cd(args or ".")
+
+    @command("ls")
+    def run_ls(self, args, stdin):
+        yield from self.ls_lines(args)
+
+    @command("cat")
+    def run_cat(self, args, stdin):
+        if args:
+            yield from self.cat_chunks(args)
+        elif stdin is not None:
+            yield from stdin
+        else:
+            yield "cat: missing file operand\n"
+
+    @command("head")
+    def run_head(self, args, stdin):
+        unit, count, parts = self._parse_count(args)
+        if not parts and stdin is not None:
+            yield from pipeline.head_chunks(stdin, unit, count)
+        else:
+            yield self.head(args)
+
+    @command("tail")
+    def run_tail(self, args, stdin):
+        unit, count, parts = self._parse_count(args)
+        if not parts and stdin is not None:
+            yield from pipeline.tail_chunks(stdin, unit, count)
+        else:
+            yield self.tail(args)
+
+    @command("grep")
+    def run_grep(self, args, stdin):
+        yield from self.grep(args, stdin)
+
+    @command("find")
+    def run_find(self, args, stdin):
+        yield from self.find_lines(args)
+
+    @command("uname")
+    def run_uname(self, args, stdin):
+        yield self.uname()
+
+    @command("rmdir")
+    def run_rmdir(self, args, stdin):
+        if not args:
+            yield "rmdir: missing operand\n"
+        else:
+            yield self.rmdir(args)
+
+    @command("sync")
+    def run_sync(self, args, stdin):
+        yield self.sync()
+
+    @command("exit")
+    def run_exit(self, args, stdin):
+        yield self.exit()
+
     def get_prompt(self):
         relative_dir = os.path.relpath(self.current_dir, self.filename_without_extension)
         relative_dir = relative_dir.replace("\\", "/")
         return f"{self.user_name}@{self.computer_name}:/{relative_dir if relative_dir != '.' else ''}$ "
 
 class TerminalApp:
+    # Commands run on a worker thread; the Tk thread only renders their output
+    RENDER_INTERVAL_MS = 30
+    RENDER_BATCH_BYTES = 256 * 1024
+    OUTPUT_QUEUE_SIZE = 256
+    DEFAULT_SCROLLBACK = 5000
+    QUIT = object()
+
     def __init__(self, config_path):
         # Load configuration
         with open(config_path) as config_file:
             config = json.load(config_file)
 
-        user_name = config['user_name']
-        computer_name = config['computer_name']
-        path = config['path']
         self.script_path = config.get('script', '')
+        self.scrollback = config.get('scrollback', self.DEFAULT_SCROLLBACK)
+
+        self.command_processor = CommandProcessor.from_config(config)
 
-        self.command_processor = CommandProcessor(user_name, computer_name, path)
+        # Bounded, so a huge cat waits for the UI instead of piling up in memory
+        self.commands = queue.Queue()
+        self.output = queue.Queue(maxsize=self.OUTPUT_QUEUE_SIZE)
+        self.worker = threading.Thread(target=self.run_worker, daemon=True)
 
         # Initialize Tkinter
         self.root = tk.Tk()
@@ -128,10 +578,10 @@ class TerminalApp:
         self.display_prompt()
 
         # Execute commands from script
+        self.worker.start()
         self.execute_script()
 
-        self.display_prompt()
-
+        self.root.after(self.RENDER_INTERVAL_MS, self.render_output)
         self.root.mainloop()
 
     def execute_command(self, event=None):
@@ -141,8 +591,7 @@ class TerminalApp:
         command = last_line.split('$', 1)[-1].strip()
         self.console.insert(tk.END, "\n")
 
-        self.run_command(command)
-        self.display_prompt()
+        self.commands.put(("command", command))
 
     def display_prompt(self):
         prompt = self.command_processor.get_prompt()
@@ -151,41 +600,82 @@ class TerminalApp:
 
     def execute_script(self):
         if self.script_path and os.path.isfile(self.script_path):
-            with open(self.script_path, 'r') as script_file:
-                first_command = True
-                for line in script_file:
-                    command = line.strip()
-                    if command:
-                        if not first_command:
-                            self.display_prompt()
-                        self.console.insert(tk.END, f"{command}\n")
-                        self.run_command(command)
-                        first_command = False
+            self.commands.put(("script", self.script_path))
+
+    def run_worker(self):
+        while True:
+            kind, payload = self.commands.get()
+            if kind == "script":
+                with open(payload, 'r') as script_file:
+                    first_command = True
+                    for line in script_file:
+                        command = line.strip()
+                        if command:
+                            if not first_command:
+                                self.output.put(self.command_processor.get_prompt())
+                            self.output.put(f"{command}\n")
+                            if not self.run_command(command):
+                                return
+                            first_command = False
+            elif not self.run_command(payload):
+                return
+            self.output.put(self.command_processor.get_prompt())
 
     def run_command(self, command):
-        if command.startswith("cd "):
-            path = command[3:].strip()
-            output = self.command_processor.cd(path)
-        elif command == "ls":
-            output = self.command_processor.ls()
-        elif command.startswith("cat "):
-            file_path = command[4:].strip()
-            output = self.command_processor.cat(file_path)
-        elif command == "uname":
-            output = self.command_processor.uname()
-        elif command.startswith("rmdir "):
-            dir_path = command[6:].strip()
-            output = self.command_processor.rmdir(dir_path)
-        elif command == "exit":
-            output = self.command_processor.exit()
-            self.console.insert(tk.END, output)
+        # Runs on the worker thread; returns False once the session has ended.
+        # While the UI is behind (the queue is full), chunks are merged into
+        # one item of up to RENDER_BATCH_BYTES, so a listing of many short
+        # lines is not one queue item per line.
+        pending = []
+        size = 0
+        for chunk in self.command_processor.run(command):
+            if not chunk:
+                continue
+            pending.append(chunk)
+            size += len(chunk)
+            if size >= self.RENDER_BATCH_BYTES or not self.output.full():
+                self.output.put("".join(pending))
+                pending = []
+                size = 0
+        if pending:
+            self.output.put("".join(pending))
+        if command == "exit":
+            self.output.put(self.QUIT)
+            return False
+        return True
+
+    def render_output(self):
+        # Gather what the worker produced since the last tick into one insert
+        chunks = []
+        size = 0
+        quit_requested = False
+        while size < self.RENDER_BATCH_BYTES:
+            try:
+                chunk = self.output.get_nowait()
+            except queue.Empty:
+                break
+            if chunk is self.QUIT:
+                quit_requested = True
+                break
+            if chunk:
+                chunks.append(chunk)
+                size += len(chunk)
+
+        if chunks:
+            self.console.insert(tk.END, "".join(chunks))
+            self.trim_scrollback()
+            self.console.see(tk.END)
+        if quit_requested:
             self.root.quit()
             return
-        else:
-            output = f"Unknown command: {command}\n"
+        self.root.after(self.RENDER_INTERVAL_MS, self.render_output)
 
-        self.console.insert(tk.END, output)
-        self.console.see(tk.END)
+    def trim_scrollback(self):
+        if not self.scrollback:
+            return
+        lines = int(self.console.index("end-1c").split(".")[0])
+        if lines > self.scrollback:
+            self.console.delete("1.0", f"{lines - self.scrollback + 1}.0")
 
 if __name__ == "__main__":
     TerminalApp("D:\\Projects\\config_managment\\task1\\config.json")
\ No newline at end of file
@@ -0,0 +1,70 @@
+import json
+import os
+
+
+class Overlay:
+    def __init__(self, journal_path=None):
+        self.journal_path = journal_path
+        self.journal = None
+        # Paths removed since the archive was last compacted
+        self.removed = set()
+
+    def __bool__(self):
+        return bool(self.removed)
+
+    def is_removed(self, path):
+        while path:
+            if path in self.removed:
+                return True
+            path = path.rpartition('/')[0]
+        return False
+
+    def rmdir(self, path):
+        self._apply({"op": "rmdir", "path": path})
+        self._append({"op": "rmdir", "path": path})
+
+    def _apply(self, entry):
+        if entry["op"] == "rmdir":
+            self.removed.add(entry["path"])
+        else:
+            raise ValueError(f"Unknown journal operation: {entry['op']}")
+
+    def _append(self, entry):
+        if self.journal_path is None:
+            return
+        if self.journal is None:
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.journal.write(json.dumps(entry) + "\n")
+        self.journal.flush()
+
+    def replay(self):
+        if self.journal_path is None or not os.path.isfile(self.journal_path):
+            return 0
+        replayed = 0
+        valid_length = 0
+        with open(self.journal_path, 'rb') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash can leave a partly written last line behind
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self._apply(entry)
+                replayed += 1
+                valid_length += len(line)
+        if valid_length != os.path.getsize(self.journal_path):
+            os.truncate(self.journal_path, valid_length)
+        return replayed
+
+    def clear(self):
+        self.removed.clear()
+        self.close()
+        if self.journal_path is not None and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
@@ -0,0 +1,86 @@
+from collections import deque
+
+
+def split_pipeline(command):
+    # Splits on '|' outside of quotes
+    stages = []
+    current = []
+    quote = None
+    for character in command:
+        if quote:
+            if character == quote:
+                quote = None
+        elif character in ('"', "'"):
+            quote = character
+        elif character == '|':
+            stages.append("".join(current).strip())
+            current = []
+            continue
+        current.append(character)
+    stages.append("".join(current).strip())
+    return stages
+
+
+def iter_lines(chunks):
+    # Regroups text chunks into lines, keeping their line breaks. An unfinished
+    # line is kept as a list of pieces and joined once, when its line break
+    # arrives, so a very long line costs linear time.
+    carry = []
+    for chunk in chunks:
+        start = 0
+        end = chunk.find("\n") + 1
+        while end:
+            if carry:
+                carry.append(chunk[start:end])
+                yield "".join(carry)
+                carry = []
+            else:
+                yield chunk[start:end]
+            start = end
+            end = chunk.find("\n", start) + 1
+        if start < len(chunk):
+            carry.append(chunk[start:])
+    if carry:
+        yield "".join(carry)
+
+
+def head_chunks(chunks, unit, count):
+    # Stops pulling from upstream as soon as enough has been produced
+    try:
+        remaining = count
+        pieces = chunks if unit == 'c' else iter_lines(chunks)
+        if remaining > 0:
+            for piece in pieces:
+                if unit == 'c':
+                    piece = piece[:remaining]
+                    remaining -= len(piece)
+                else:
+                    remaining -= 1
+                yield piece
+                if remaining <= 0:
+                    break
+    finally:
+        chunks.close()
+
+
+def tail_chunks(chunks, unit, count):
+    # Has to see the whole stream, but keeps only what it will print
+    if unit == 'c':
+        kept = deque()
+        size = 0
+        for chunk in chunks:
+            kept.append(chunk)
+            size += len(chunk)
+            while kept and size - len(kept[0]) >= count:
+                size -= len(kept.popleft())
+        text = "".join(kept)
+        yield text[-count:] if count else ""
+    else:
+        if count:
+            yield from deque(iter_lines(chunks), maxlen=count)
+
+
+def grep_chunks(chunks, regex):
+    for line in iter_lines(chunks):
+        if regex.search(line.rstrip("\n")):
+            yield line if line.endswith("\n") else line + "\n"
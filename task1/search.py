@@ -0,0 +1,108 @@
+import re
+import shlex
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Most bytes of one line held for matching before it is cut
+PIECE_SIZE = 1024 * 1024
+
+
+def parse_find_args(args):
+    # [PATH] [-name GLOB] [-type f|d]
+    parts = shlex.split(args)
+    options = {"path": ".", "name": None, "type": None}
+    if parts and not parts[0].startswith('-'):
+        options["path"] = parts.pop(0)
+    while parts:
+        flag = parts.pop(0)
+        if flag not in ('-name', '-type') or not parts:
+            raise ValueError(f"find: unknown predicate '{flag}'")
+        value = parts.pop(0)
+        if flag == '-type' and value not in ('f', 'd'):
+            raise ValueError(f"find: unknown argument to -type: {value}")
+        options[flag[1:]] = value
+    return options
+
+
+def parse_grep_args(args):
+    # [-r] [-i] [-j WORKERS] PATTERN [PATH]
+    parts = shlex.split(args)
+    options = {"recursive": False, "ignore_case": False, "workers": None}
+    while parts and parts[0].startswith('-') and len(parts[0]) > 1:
+        flag = parts.pop(0)
+        if flag == '-j' and parts and parts[0].isdigit():
+            options["workers"] = int(parts.pop(0))
+            continue
+        for letter in flag[1:]:
+            if letter == 'r':
+                options["recursive"] = True
+            elif letter == 'i':
+                options["ignore_case"] = True
+            else:
+                raise ValueError(f"grep: invalid option -- '{letter}'")
+    if not parts or len(parts) > 2:
+        raise ValueError("grep: usage: grep [-r] [-i] [-j WORKERS] PATTERN [PATH]")
+    pattern = parts[0]
+    options["path"] = parts[1] if len(parts) == 2 else None
+    try:
+        options["regex"] = re.compile(pattern, re.IGNORECASE if options["ignore_case"] else 0)
+    except re.error as e:
+        raise ValueError(f"grep: {pattern}: {e}")
+    return options
+
+
+def line_pieces(name, chunks, size=PIECE_SIZE):
+    # Regroups a file's data chunks into pieces that end on a line break. The
+    # start of an unfinished line is kept as a list and joined once. A single
+    # line longer than `size` is handed on in parts of about `size` bytes, so
+    # grep reports it as several lines.
+    carry = []
+    carried = 0
+    for chunk in chunks:
+        cut = chunk.rfind(b"\n") + 1
+        if cut == 0:
+            carry.append(chunk)
+            carried += len(chunk)
+            if carried >= size:
+                yield name, b"".join(carry)
+                carry = []
+                carried = 0
+            continue
+        yield name, b"".join(carry + [chunk[:cut]]) if carry else chunk[:cut]
+        carry = [chunk[cut:]] if cut < len(chunk) else []
+        carried = len(chunk) - cut
+    if carry:
+        yield name, b"".join(carry)
+
+
+def match_piece(regex, name, data, show_name):
+    lines = []
+    for line in data.decode('utf-8', errors='replace').splitlines():
+        if regex.search(line):
+            lines.append(f"{name}:{line}\n" if show_name else f"{line}\n")
+    return "".join(lines)
+
+
+def grep_pieces(pieces, regex, show_name, workers=0):
+    # Matches pieces in order. With workers, decoding and matching run in a
+    # pool while the caller keeps reading ahead; only a bounded number of
+    # pieces are held in flight.
+    if not workers:
+        for name, data in pieces:
+            output = match_piece(regex, name, data, show_name)
+            if output:
+                yield output
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for name, data in pieces:
+            pending.append(pool.submit(match_piece, regex, name, data, show_name))
+            if len(pending) >= workers * 4:
+                output = pending.popleft().result()
+                if output:
+                    yield output
+        while pending:
+            output = pending.popleft().result()
+            if output:
+                yield output
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import json
+import os
+import queue
+import sys
+import threading
+from main import ArchiveImage, CommandProcessor
+from cache import DEFAULT_CACHE_SIZE
+
+
+# Marks the end of a command's output in EmulatorServer.run_command
+COMMAND_DONE = object()
+
+
+class EmulatorServer:
+    # Hosts many shell sessions over one archive image. Every session gets its
+    # own working directory and overlay; the member index and block cache are
+    # shared, so adding sessions costs neither startup time nor memory.
+    OUTPUT_QUEUE_SIZE = 256
+    OUTPUT_BATCH_BYTES = 256 * 1024
+
+    def __init__(self, image, user_name, computer_name):
+        self.image = image
+        self.user_name = user_name
+        self.computer_name = computer_name
+        self.sessions = set()
+        self.server = None
+
+    def new_session(self):
+        return CommandProcessor(self.user_name, self.computer_name, image=self.image)
+
+    async def handle_client(self, reader, writer):
+        processor = self.new_session()
+        self.sessions.add(processor)
+        try:
+            writer.write(processor.get_prompt().encode())
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('utf-8', errors='replace').strip()
+                if command:
+                    await self.run_command(processor, command, writer)
+                if command == "exit":
+                    break
+                writer.write(processor.get_prompt().encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            processor.exit()
+            self.sessions.discard(processor)
+            writer.close()
+
+    async def run_command(self, processor, command, writer):
+        # Commands read the archive, so each one runs on its own thread and hands
+        # its chunks over through a bounded queue. Every hop back to the event
+        # loop takes whatever has piled up, up to OUTPUT_BATCH_BYTES: many short
+        # lines cost a few writes, and a slow command's first lines still go out
+        # at once.
+        chunks = queue.Queue(maxsize=self.OUTPUT_QUEUE_SIZE)
+        cancelled = threading.Event()
+        producer = threading.Thread(target=self.produce, args=(processor, command, chunks, cancelled), daemon=True)
+        producer.start()
+        try:
+            while True:
+                batch, end = await asyncio.to_thread(self.take_batch, chunks)
+                if batch:
+                    writer.write(batch.encode())
+                    await writer.drain()
+                if isinstance(end, Exception):
+                    raise end
+                if end is COMMAND_DONE:
+                    break
+        finally:
+            # The session must not be used by two threads at once
+            cancelled.set()
+            await asyncio.to_thread(producer.join)
+
+    @staticmethod
+    def produce(processor, command, chunks, cancelled):
+        def hand_over(item):
+            while not cancelled.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for chunk in processor.run(command):
+                if chunk and not hand_over(chunk):
+                    return
+        except Exception as e:
+            hand_over(e)
+            return
+        hand_over(COMMAND_DONE)
+
+    @classmethod
+    def take_batch(cls, chunks):
+        # Waits for the first chunk, then takes whatever else is ready. Returns
+        # the text and, once the command has ended, COMMAND_DONE or its error.
+        parts = []
+        size = 0
+        item = chunks.get()
+        while True:
+            if item is COMMAND_DONE or isinstance(item, Exception):
+                return "".join(parts), item
+            parts.append(item)
+            size += len(item)
+            if size >= cls.OUTPUT_BATCH_BYTES:
+                return "".join(parts), None
+            try:
+                item = chunks.get_nowait()
+            except queue.Empty:
+                return "".join(parts), None
+
+    async def start(self, host=None, port=None, unix_path=None):
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def serve_forever(self, host=None, port=None, unix_path=None):
+        server = await self.start(host, port, unix_path)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve emulator sessions over a socket')
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'),
+                        help='Path to config.json')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8023, help='TCP port to listen on')
+    parser.add_argument('--unix', help='Listen on this Unix socket instead of TCP')
+    args = parser.parse_args(argv)
+
+    with open(args.config) as config_file:
+        config = json.load(config_file)
+
+    image = ArchiveImage(config['path'], config.get('cache_size', DEFAULT_CACHE_SIZE))
+    server = EmulatorServer(image, config['user_name'], config['computer_name'])
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        image.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,32 @@
 import unittest
 import os
+import sys
+import json
+import subprocess
+import shutil
+import tempfile
 import platform
 import tarfile
-from io import BytesIO
-from main import CommandProcessor
+import queue
+import threading
+import time
+from io import BytesIO, StringIO
+from main import ArchiveImage, CommandProcessor, TerminalApp
+import archive
+import pipeline
+import search
+from cache import BlockCache
+import gzip
+import bz2
+import lzma
+import warnings
+from compressed import GzipCheckpointReader, Bz2CheckpointReader, XzBlockReader, ChunkedStreamWriter
+from batch import BatchRunner
+from server import EmulatorServer
+import asyncio
+import bench
+import bench_scale
+import vfs
 
 class TestCommandProcessor(unittest.TestCase):
     def setUp(self):
@@ -33,6 +56,9 @@ class TestCommandProcessor(unittest.TestCase):
         self.processor.exit()
         if os.path.exists(self.test_tar_path):
             os.remove(self.test_tar_path)
+        for suffix in ('.journal', '.idx'):
+            if os.path.exists(self.test_tar_path + suffix):
+                os.remove(self.test_tar_path + suffix)
 
     def test_cd_existing_directory(self):
         # Test changing to an existing directory
@@ -80,6 +106,27 @@ class TestCommandProcessor(unittest.TestCase):
         self.assertEqual(output, "cat: non_existing_file.txt: No such file\n")
 
 
+    def test_ls_sorted_with_implied_directories(self):
+        with tarfile.open(self.test_tar_path, 'a') as tar:
+            content = b"deep"
+            info = tarfile.TarInfo('test_fs/home/zeta/deep/file.txt')
+            info.size = len(content)
+            tar.addfile(info, fileobj=BytesIO(content))
+            info = tarfile.TarInfo('test_fs/home/alpha.txt')
+            tar.addfile(info, fileobj=BytesIO(b""))
+        self.processor.exit()
+        self.processor = CommandProcessor('user', 'computer', self.test_tar_path)
+
+        self.processor.cd('home')
+        self.assertEqual(self.processor.ls(), "alpha.txt\nolya\ntest_file.txt\nzeta\n")
+        self.assertEqual(self.processor.cd('zeta/deep'), "")
+        self.assertEqual(self.processor.cat('file.txt'), "deep\n")
+
+    def test_cd_into_file(self):
+        output = self.processor.cd('home/test_file.txt')
+        self.assertEqual(output, "cd: no such file or directory\n")
+        self.assertEqual(self.processor.current_dir, 'test_fs')
+
     def test_uname(self):
         output = self.processor.uname()
         self.assertEqual(output, platform.system() + "\n")
@@ -104,6 +151,95 @@ class TestCommandProcessor(unittest.TestCase):
         self.processor.cd("..")
 
 
+    def test_rmdir_rewrites_archive_on_sync(self):
+        output = self.processor.rmdir('home/olya')
+        self.assertEqual(output, "Directory home/olya removed successfully\n")
+        self.assertEqual(self.processor.cd('home/olya'), "cd: no such file or directory\n")
+        self.assertEqual(self.processor.ls(), "home\n")
+
+        # The archive itself is untouched until sync
+        with tarfile.open(self.test_tar_path, 'r') as tar:
+            self.assertIn('test_fs/home/olya', tar.getnames())
+
+        self.assertEqual(self.processor.sync(), "")
+        self.assertFalse(os.path.exists(self.test_tar_path + '.journal'))
+
+        # Remaining members moved in the archive but are still readable
+        self.assertEqual(self.processor.cat('home/test_file.txt'), "Hello, World!\n")
+        self.processor.cd('home')
+        self.assertEqual(self.processor.ls(), "test_file.txt\n")
+
+        with tarfile.open(self.test_tar_path, 'r') as tar:
+            names = tar.getnames()
+        self.assertNotIn('test_fs/home/olya', names)
+        self.assertIn('test_fs/home/test_file.txt', names)
+
+    def test_exit_compacts_overlay(self):
+        self.processor.rmdir('home/olya')
+        self.assertEqual(self.processor.exit(), "")
+
+        with tarfile.open(self.test_tar_path, 'r') as tar:
+            self.assertNotIn('test_fs/home/olya', tar.getnames())
+
+    def test_journal_replayed_after_crash(self):
+        self.processor.rmdir('home/olya')
+
+        # Simulate a crash: the first processor never reaches exit
+        recovered = CommandProcessor('user', 'computer', self.test_tar_path)
+        self.assertEqual(recovered.cd('home/olya'), "cd: no such file or directory\n")
+        self.assertEqual(recovered.exit(), "")
+        self.processor.image.close()
+
+        with tarfile.open(self.test_tar_path, 'r') as tar:
+            self.assertNotIn('test_fs/home/olya', tar.getnames())
+        self.assertFalse(os.path.exists(self.test_tar_path + '.journal'))
+
+    def test_rmdir_current_directory(self):
+        self.processor.cd('home/olya')
+        self.processor.rmdir('.')
+        self.assertEqual(self.processor.current_dir, 'test_fs/home')
+        # A working directory that disappeared underneath is reported as "."
+        self.processor.current_dir = 'test_fs/home/olya'
+        self.assertEqual(self.processor.ls(), "ls: cannot access '.': No such directory\n")
+
+    def test_rmdir_root_refused(self):
+        self.assertEqual(self.processor.rmdir('.'), "rmdir: .: Cannot remove the root directory\n")
+        self.processor.cd('home')
+        self.assertEqual(self.processor.rmdir('..'), "rmdir: ..: Cannot remove the root directory\n")
+        self.assertEqual(self.processor.current_dir, 'test_fs/home')
+        self.assertEqual(self.processor.sync(), "")
+        self.assertEqual(self.processor.ls('..'), "home\n")
+
+    def test_sidecar_index_reused(self):
+        self.assertTrue(os.path.exists(self.test_tar_path + '.idx'))
+        loaded = archive.load_sidecar(self.test_tar_path + '.idx', self.test_tar_path)
+        self.assertEqual(
+            [(m.name, m.type, m.size, m.offset_data) for m in loaded[0]],
+            [(m.name, m.type, m.size, m.offset_data) for m in self.processor.image.backend.members]
+        )
+
+        # A second processor starts from the sidecar and reads data through its offsets
+        second = CommandProcessor('user', 'computer', self.test_tar_path)
+        self.assertEqual(second.cat('home/test_file.txt'), "Hello, World!\n")
+        second.exit()
+
+    def test_sidecar_invalidated_by_archive_change(self):
+        with tarfile.open(self.test_tar_path, 'a') as tar:
+            info = tarfile.TarInfo('test_fs/new_dir')
+            info.type = tarfile.DIRTYPE
+            tar.addfile(info)
+        self.assertIsNone(archive.load_sidecar(self.test_tar_path + '.idx', self.test_tar_path))
+
+        second = CommandProcessor('user', 'computer', self.test_tar_path)
+        self.assertIn('new_dir', second.ls())
+        second.exit()
+
+    def test_sidecar_refreshed_after_sync(self):
+        self.processor.rmdir('home/olya')
+        self.processor.sync()
+        loaded = archive.load_sidecar(self.test_tar_path + '.idx', self.test_tar_path)
+        self.assertNotIn('test_fs/home/olya', [m.name for m in loaded[0]])
+
     def test_exit(self):
         # Test the exit command
         output = self.processor.exit()
@@ -126,5 +262,604 @@ class TestCommandProcessor(unittest.TestCase):
         self.processor.cd("..")
 
 
+class PagedArchiveCase(unittest.TestCase):
+    # Shared fixture: a log spanning many cache blocks and a small UTF-8 file
+    def setUp(self):
+        self.test_tar_path = 'test_fs.tar'
+        # Lines long enough that the file spans several cache blocks
+        self.lines = [f"line {i:05d} " + "x" * 200 + "\n" for i in range(2000)]
+        self.content = "".join(self.lines).encode()
+        with tarfile.open(self.test_tar_path, 'w') as tar:
+            info = tarfile.TarInfo('test_fs/big.log')
+            info.size = len(self.content)
+            tar.addfile(info, fileobj=BytesIO(self.content))
+            text = "первая\nвторая\nтретья".encode()
+            info = tarfile.TarInfo('test_fs/utf8.txt')
+            info.size = len(text)
+            tar.addfile(info, fileobj=BytesIO(text))
+
+        self.processor = CommandProcessor('user', 'computer', self.test_tar_path, cache_size=1024 * 1024)
+
+    def tearDown(self):
+        self.processor.exit()
+        for suffix in ('', '.journal', '.idx'):
+            if os.path.exists(self.test_tar_path + suffix):
+                os.remove(self.test_tar_path + suffix)
+
+
+class TestPagedCat(PagedArchiveCase):
+    def test_cat_streams_chunks(self):
+        chunks = list(self.processor.cat_chunks('big.log'))
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual("".join(chunks), self.content.decode() + "\n")
+
+    def test_cat_decodes_across_block_boundaries(self):
+        # Three-byte blocks split most of the two-byte Cyrillic characters
+        self.processor.image.cache = BlockCache(block_size=3)
+        self.assertEqual(self.processor.cat('utf8.txt'), "первая\nвторая\nтретья\n")
+        self.assertEqual(self.processor.tail('-n 2 utf8.txt'), "вторая\nтретья\n")
+
+    def test_head_and_tail(self):
+        self.assertEqual(self.processor.head('big.log'), "".join(self.lines[:10]))
+        self.assertEqual(self.processor.head('-n 3 big.log'), "".join(self.lines[:3]))
+        self.assertEqual(self.processor.tail('-n 2 big.log'), "".join(self.lines[-2:]))
+        self.assertEqual(self.processor.tail('-n 700 big.log'), "".join(self.lines[-700:]))
+        self.assertEqual(self.processor.head('-c 4 big.log'), "line\n")
+        self.assertEqual(self.processor.tail('-n 1 utf8.txt'), "третья\n")
+        self.assertEqual(self.processor.tail('-n 5 missing.txt'), "tail: missing.txt: No such file\n")
+
+    def test_tail_reads_only_last_blocks(self):
+        self.processor.tail('-n 2 big.log')
+        self.assertLessEqual(self.processor.image.cache.misses, 2)
+
+    def test_repeated_reads_hit_cache(self):
+        self.processor.cat('big.log')
+        misses = self.processor.image.cache.misses
+        self.processor.cat('big.log')
+        self.assertEqual(self.processor.image.cache.misses, misses)
+        self.assertGreater(self.processor.image.cache.hits, 0)
+        self.assertLessEqual(self.processor.image.cache.size, 1024 * 1024)
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.test_tar_path = 'test_fs.tar'
+        files = {
+            'test_fs/etc/hosts': b"127.0.0.1 localhost\n::1 localhost\n",
+            'test_fs/home/olya/notes.txt': b"buy milk\nError: disk full\n",
+            'test_fs/home/vasya/log.txt': b"".join(b"line %d\n" % i for i in range(50000)) + b"ERROR at end",
+            'test_fs/home/vasya/readme.md': b"nothing here\n",
+        }
+        with tarfile.open(self.test_tar_path, 'w') as tar:
+            for name, content in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, fileobj=BytesIO(content))
+        self.processor = CommandProcessor('user', 'computer', self.test_tar_path)
+
+    def tearDown(self):
+        self.processor.exit()
+        for suffix in ('', '.journal', '.idx'):
+            if os.path.exists(self.test_tar_path + suffix):
+                os.remove(self.test_tar_path + suffix)
+
+    def test_find(self):
+        self.assertEqual(self.processor.find('-name "*.txt"'), "./home/olya/notes.txt\n./home/vasya/log.txt\n")
+        self.assertEqual(self.processor.find('home -type d'), "home\nhome/olya\nhome/vasya\n")
+        self.processor.cd('home')
+        self.assertEqual(self.processor.find('vasya -type f -name "r*"'), "vasya/readme.md\n")
+        self.assertEqual(self.processor.find('missing'), "find: 'missing': No such file or directory\n")
+
+    def test_find_skips_removed(self):
+        self.processor.rmdir('home/olya')
+        self.assertEqual(self.processor.find('-type d'), ".\n./etc\n./home\n./home/vasya\n")
+
+    def test_grep_recursive(self):
+        output = "".join(self.processor.grep('-r -i error .'))
+        self.assertEqual(output, "./home/olya/notes.txt:Error: disk full\n./home/vasya/log.txt:ERROR at end\n")
+
+    def test_line_pieces(self):
+        chunks = [b"ab", b"c\nde", b"f\ng", b"h"]
+        pieces = [data for _, data in search.line_pieces('f', iter(chunks))]
+        self.assertEqual(pieces, [b"abc\n", b"def\n", b"gh"])
+        # A line with no break in sight is cut instead of growing without bound
+        pieces = [data for _, data in search.line_pieces('f', iter([b"x" * 1000] * 50), size=4096)]
+        self.assertEqual(b"".join(pieces), b"x" * 50000)
+        self.assertTrue(all(len(data) <= 4096 + 1000 for data in pieces))
+
+    def test_grep_single_file_and_errors(self):
+        self.assertEqual("".join(self.processor.grep('localhost etc/hosts')), "127.0.0.1 localhost\n::1 localhost\n")
+        self.assertEqual("".join(self.processor.grep('x home')), "grep: home: Is a directory\n")
+        self.assertEqual("".join(self.processor.grep('x nope.txt')), "grep: nope.txt: No such file or directory\n")
+
+    def test_grep_thread_pool_keeps_archive_order(self):
+        serial = "".join(self.processor.grep('-r "line 4999" home'))
+        pooled = "".join(self.processor.grep('-r -j 4 "line 4999" home'))
+        self.assertEqual(serial, pooled)
+        self.assertTrue(serial.startswith("home/vasya/log.txt:line 4999\n"))
+        self.assertEqual(serial.count("\n"), 11)
+
+    def test_grep_bypasses_block_cache(self):
+        "".join(self.processor.grep('-r ERROR .'))
+        self.assertEqual(self.processor.image.cache.size, 0)
+
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.tree = {
+            'home': None,
+            'home/olya': None,
+            'home/olya/notes.txt': b"notes",
+            'home/test_file.txt': b"Hello, World!",
+            'usr': None,
+        }
+        tar_path = os.path.join(self.workdir, 'fs.tar')
+        zip_path = os.path.join(self.workdir, 'fs.zip')
+        dir_path = os.path.join(self.workdir, 'tree', 'fs')
+        bench.write_tar(self.tree, tar_path)
+        bench.write_zip(self.tree, zip_path)
+        bench.write_dir(self.tree, dir_path)
+        self.factories = {
+            'tar': lambda: vfs.open_backend(tar_path),
+            'zip': lambda: vfs.open_backend(zip_path),
+            'dir': lambda: vfs.open_backend(dir_path),
+            'memory': lambda: vfs.MemoryBackend(self.tree),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_same_semantics_on_every_backend(self):
+        for name, factory in self.factories.items():
+            with self.subTest(backend=name):
+                backend = factory()
+                processor = CommandProcessor('user', 'computer', backend=backend)
+                self.assertEqual(processor.get_prompt(), "user@computer:/$ ")
+                self.assertEqual(processor.ls(), "home\nusr\n")
+                self.assertEqual(processor.cd('home'), "")
+                self.assertEqual(processor.ls(), "olya\ntest_file.txt\n")
+                self.assertEqual(processor.cat('test_file.txt'), "Hello, World!\n")
+                self.assertEqual(processor.cat('olya/notes.txt'), "notes\n")
+                self.assertEqual(processor.rmdir('olya'), "Directory olya removed successfully\n")
+                self.assertEqual(processor.sync(), "")
+                self.assertEqual(processor.ls(), "test_file.txt\n")
+                self.assertEqual(processor.cat('test_file.txt'), "Hello, World!\n")
+                self.assertEqual(processor.exit(), "")
+
+                # The removal was written back to the storage itself
+                reopened = CommandProcessor('user', 'computer', backend=factory() if name != 'memory' else backend)
+                self.assertEqual(reopened.cd('home/olya'), "cd: no such file or directory\n")
+                reopened.exit()
+
+    def test_open_backend_picks_format(self):
+        for name, backend_class in (('tar', vfs.TarBackend), ('zip', vfs.ZipBackend), ('dir', vfs.DirBackend)):
+            backend = self.factories[name]()
+            self.assertIsInstance(backend, backend_class)
+            backend.close()
+
+    def test_benchmark_runs_every_backend(self):
+        results = bench.run_benchmark(directories=3, files_per_directory=2, file_size=256, commands=4)
+        self.assertEqual({result["backend"] for result in results}, {'tar', 'tar.gz', 'zip', 'dir', 'memory'})
+        self.assertTrue(all(result["commands"] > 0 for result in results))
+
+    def test_scale_benchmark_case(self):
+        path = os.path.join(self.workdir, 'fs.tar')
+        bench_scale.generate_archive(path, 120, 3, [0, 100])
+        processor = CommandProcessor('a', 'b', path)
+        self.assertEqual(len(processor.image.index.entries), 120 + 1)
+        processor.exit()
+
+        size = os.path.getsize(path)
+        result = bench_scale.run_case(path, repeat=3, script_commands=12)
+        self.assertLess(os.path.getsize(path), size)
+        self.assertGreater(result["script_commands"], 0)
+        self.assertGreater(result["cold_startup_seconds"], 0)
+
+
+class StubConsole:
+    # Just enough of a Tk text widget for TerminalApp's rendering
+    def __init__(self):
+        self.text = ""
+
+    def insert(self, index, text):
+        self.text += text
+
+    def index(self, index):
+        return f"{self.text.count(chr(10)) + 1}.0"
+
+    def delete(self, start, end):
+        lines = self.text.split("\n")
+        self.text = "\n".join(lines[int(end.split(".")[0]) - 1:])
+
+    def see(self, index):
+        pass
+
+
+class StubRoot:
+    def __init__(self):
+        self.quit_called = False
+
+    def after(self, delay, callback):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+class TestTerminalApp(unittest.TestCase):
+    # The worker, queue and render loop of the GUI, without a display
+    def setUp(self):
+        self.test_tar_path = 'test_fs.tar'
+        with tarfile.open(self.test_tar_path, 'w') as tar:
+            info = tarfile.TarInfo('test_fs/home')
+            info.type = tarfile.DIRTYPE
+            tar.addfile(info)
+            info = tarfile.TarInfo('test_fs/home/test_file.txt')
+            info.size = 13
+            tar.addfile(info, fileobj=BytesIO(b"Hello, World!"))
+
+        self.app = TerminalApp.__new__(TerminalApp)
+        self.app.command_processor = CommandProcessor('user', 'computer', self.test_tar_path)
+        self.app.scrollback = 0
+        self.app.commands = queue.Queue()
+        self.app.output = queue.Queue(maxsize=TerminalApp.OUTPUT_QUEUE_SIZE)
+        self.app.console = StubConsole()
+        self.app.root = StubRoot()
+
+    def tearDown(self):
+        self.app.command_processor.exit()
+        for suffix in ('', '.journal', '.idx'):
+            if os.path.exists(self.test_tar_path + suffix):
+                os.remove(self.test_tar_path + suffix)
+
+    def run_session(self, commands, interval=0):
+        # Runs the worker on its thread and renders on this one until QUIT
+        for command in commands:
+            self.app.commands.put(("command", command))
+        worker = threading.Thread(target=self.app.run_worker, daemon=True)
+        worker.start()
+        ticks = 0
+        while not self.app.root.quit_called:
+            self.app.render_output()
+            ticks += 1
+            time.sleep(interval)
+        worker.join(timeout=5)
+        self.assertFalse(worker.is_alive())
+        return ticks
+
+    def test_output_order_and_quit(self):
+        self.run_session(["cd home", "ls", "cat test_file.txt", "exit"])
+        self.assertEqual(self.app.console.text,
+                         "user@computer:/home$ test_file.txt\nuser@computer:/home$ Hello, World!\n"
+                         "user@computer:/home$ ")
+        # Nothing after exit is rendered
+        self.assertTrue(self.app.output.empty())
+
+    def test_long_output_is_batched(self):
+        lines = [f"entry {i:06d}\n" for i in range(100000)]
+        self.app.command_processor.run = lambda command: iter(lines) if command != "exit" else iter([])
+        ticks = self.run_session(["ls", "exit"], interval=TerminalApp.RENDER_INTERVAL_MS / 1000)
+        self.assertEqual(self.app.console.text, "".join(lines) + "user@computer:/$ ")
+        # One queue item per line would take 100000 / OUTPUT_QUEUE_SIZE ticks
+        self.assertLess(ticks, 50)
+
+    def test_scrollback_trimmed(self):
+        self.app.scrollback = 3
+        self.app.console.insert("end", "".join(f"line {i}\n" for i in range(10)))
+        self.app.trim_scrollback()
+        self.assertEqual(self.app.console.text, "line 8\nline 9\n")
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.test_tar_path = 'test_fs.tar'
+        self.config_path = 'test_config.json'
+        self.script_path = 'test_script.sh'
+        with tarfile.open(self.test_tar_path, 'w') as tar:
+            for name in ('test_fs/home', 'test_fs/home/olya'):
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            info = tarfile.TarInfo('test_fs/home/test_file.txt')
+            info.size = 13
+            tar.addfile(info, fileobj=BytesIO(b"Hello, World!"))
+        with open(self.config_path, 'w') as config_file:
+            json.dump({"user_name": "user", "computer_name": "computer", "path": self.test_tar_path}, config_file)
+        with open(self.script_path, 'w') as script_file:
+            script_file.write("ls\ncd home\n\ncat test_file.txt\nrmdir olya\n")
+
+    def tearDown(self):
+        for path in (self.test_tar_path, self.test_tar_path + '.journal', self.test_tar_path + '.idx',
+                     self.config_path, self.script_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_runner_transcript_and_summary(self):
+        out = StringIO()
+        runner = BatchRunner(CommandProcessor('user', 'computer', self.test_tar_path), out)
+        with open(self.script_path) as script_file:
+            runner.run(script_file)
+
+        self.assertEqual(out.getvalue(), (
+            "user@computer:/$ ls\nhome\n"
+            "user@computer:/$ cd home\n"
+            "user@computer:/home$ cat test_file.txt\nHello, World!\n"
+            "user@computer:/home$ rmdir olya\nDirectory olya removed successfully\n"
+        ))
+        summary = runner.summary()
+        self.assertEqual(summary["commands"], 4)
+        self.assertLessEqual(summary["latency_ms"]["p50"], summary["latency_ms"]["max"])
+
+        # End of input compacts the archive like exit
+        with tarfile.open(self.test_tar_path, 'r') as tar:
+            self.assertNotIn('test_fs/home/olya', tar.getnames())
+
+    def test_stops_at_exit(self):
+        out = StringIO()
+        runner = BatchRunner(CommandProcessor('user', 'computer', self.test_tar_path), out, echo=False)
+        runner.run(["ls", "exit", "uname"])
+        self.assertEqual(out.getvalue(), "home\n")
+        self.assertEqual(runner.summary()["commands"], 2)
+
+    def test_command_line_reads_stdin(self):
+        result = subprocess.run(
+            [sys.executable, 'batch.py', '--config', self.config_path, '--script', '-', '--no-echo'],
+            input="cd home\nls\n",
+            capture_output=True,
+            text=True
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, "olya\ntest_file.txt\n")
+        self.assertIn("2 commands", result.stderr)
+
+
+class TestEmulatorServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.test_tar_path = 'test_fs.tar'
+        with tarfile.open(self.test_tar_path, 'w') as tar:
+            for name in ('test_fs/home', 'test_fs/home/olya'):
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            info = tarfile.TarInfo('test_fs/home/test_file.txt')
+            info.size = 13
+            tar.addfile(info, fileobj=BytesIO(b"Hello, World!"))
+
+        self.image = ArchiveImage(self.test_tar_path)
+        self.server = EmulatorServer(self.image, 'user', 'computer')
+        server = await self.server.start('127.0.0.1', 0)
+        self.port = server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.server.wait_closed()
+        self.image.close()
+        for suffix in ('', '.journal', '.idx'):
+            if os.path.exists(self.test_tar_path + suffix):
+                os.remove(self.test_tar_path + suffix)
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.assertEqual(await reader.readuntil(b"$ "), b"user@computer:/$ ")
+        return reader, writer
+
+    async def send(self, session, command):
+        reader, writer = session
+        writer.write(command.encode() + b"\n")
+        await writer.drain()
+        return (await reader.readuntil(b"$ ")).decode()
+
+    async def test_sessions_have_separate_state(self):
+        first = await self.connect()
+        second = await self.connect()
+
+        self.assertEqual(await self.send(first, "cd home"), "user@computer:/home$ ")
+        self.assertEqual(await self.send(first, "rmdir olya"),
+                         "Directory olya removed successfully\nuser@computer:/home$ ")
+        self.assertEqual(await self.send(first, "ls"), "test_file.txt\nuser@computer:/home$ ")
+
+        # The second session still sees the original tree from the root
+        self.assertEqual(await self.send(second, "ls"), "home\nuser@computer:/$ ")
+        self.assertEqual(await self.send(second, "cat home/test_file.txt"), "Hello, World!\nuser@computer:/$ ")
+        self.assertEqual(await self.send(second, "cd home/olya"), "user@computer:/home/olya$ ")
+        self.assertEqual(await self.send(second, "sync"),
+                         "sync: archive is shared read-only\nuser@computer:/home/olya$ ")
+
+        for reader, writer in (first, second):
+            writer.write(b"exit\n")
+            await writer.drain()
+            self.assertEqual(await reader.read(), b"")
+            writer.close()
+
+        self.assertEqual(self.server.sessions, set())
+        with tarfile.open(self.test_tar_path, 'r') as tar:
+            self.assertIn('test_fs/home/olya', tar.getnames())
+
+    async def test_output_is_batched(self):
+        class Writer:
+            def __init__(self):
+                self.writes = []
+
+            def write(self, data):
+                self.writes.append(data)
+
+            async def drain(self):
+                pass
+
+        processor = self.server.new_session()
+        lines = [f"entry {i}\n" for i in range(5000)]
+        processor.run = lambda command: iter(lines)
+        writer = Writer()
+        await self.server.run_command(processor, "ls", writer)
+        self.assertEqual(b"".join(writer.writes).decode(), "".join(lines))
+        # Lines that pile up while a write is in flight go out together
+        self.assertLess(len(writer.writes), len(lines) // 10)
+
+        def failing(command):
+            yield "partial\n"
+            raise OSError("archive went away")
+        processor.run = failing
+        writer = Writer()
+        with self.assertRaises(OSError):
+            await self.server.run_command(processor, "cat", writer)
+        self.assertEqual(writer.writes, [b"partial\n"])
+        processor.exit()
+
+    async def test_sessions_share_index_and_cache(self):
+        first = self.server.new_session()
+        second = self.server.new_session()
+        self.assertIs(first.image.index, second.image.index)
+        first.cat('home/test_file.txt')
+        misses = self.image.cache.misses
+        second.cat('home/test_file.txt')
+        self.assertEqual(self.image.cache.misses, misses)
+
+
+class TestPipelines(PagedArchiveCase):
+    def run_command(self, command):
+        return "".join(self.processor.run(command))
+
+    def test_lines_across_chunks(self):
+        chunks = ["ab", "c\nde", "f", "\n\ng", "h"]
+        self.assertEqual(list(pipeline.iter_lines(iter(chunks))), ["abc\n", "def\n", "\n", "gh"])
+        # One line spread over many chunks is joined once, not once per chunk
+        line = next(pipeline.iter_lines(iter(["x" * 1024] * 16384 + ["\n"])))
+        self.assertEqual(len(line), 16 * 1024 * 1024 + 1)
+
+    def test_head_stops_reading_upstream(self):
+        self.assertEqual(self.run_command("cat big.log | head -n 2"), "".join(self.lines[:2]))
+        # Only the first block of the file was ever read
+        self.assertEqual(self.processor.image.cache.misses, 1)
+
+    def test_multi_stage_pipeline(self):
+        output = self.run_command("cat big.log | grep 'line 001[0-9]9 ' | head -n 3")
+        self.assertEqual(output, self.lines[109] + self.lines[119] + self.lines[129])
+        # cat ends its output with an extra line break, which tail counts as a line
+        self.assertEqual(self.run_command("cat big.log | tail -n 2"), self.lines[-1] + "\n")
+        self.assertEqual(self.run_command("ls | grep utf"), "utf8.txt\n")
+        self.assertEqual(self.run_command("cat utf8.txt | head -c 6"), "первая")
+
+    def test_listings_stream_lines(self):
+        lines = self.processor.find_lines('.')
+        self.assertEqual(next(lines), ".\n")
+        self.assertEqual(self.run_command("find . | head -n 2"), ".\n./big.log\n")
+        self.assertEqual(list(self.processor.ls_lines()), ["big.log\n", "utf8.txt\n"])
+
+    def test_unknown_stage(self):
+        self.assertEqual(self.run_command("cat big.log | frobnicate"), "Unknown command: frobnicate\n")
+        self.assertEqual(self.run_command("lsx"), "Unknown command: lsx\n")
+
+    def test_quoted_pipe_is_not_a_separator(self):
+        self.assertEqual(self.run_command("cat big.log | grep 'zzz|line 00001 ' | head -n 1"), self.lines[1])
+
+
+class TestCompressedArchive(unittest.TestCase):
+    def setUp(self):
+        self.test_tar_path = 'test_fs.tar.gz'
+        self.content = os.urandom(200000)
+        with tarfile.open(self.test_tar_path, 'w:gz') as tar:
+            for name in ('test_fs/home', 'test_fs/home/olya'):
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            info = tarfile.TarInfo('test_fs/home/blob.bin')
+            info.size = len(self.content)
+            tar.addfile(info, fileobj=BytesIO(self.content))
+            info = tarfile.TarInfo('test_fs/home/test_file.txt')
+            info.size = 13
+            tar.addfile(info, fileobj=BytesIO(b"Hello, World!"))
+
+        self.processor = CommandProcessor('user', 'computer', self.test_tar_path)
+
+    def tearDown(self):
+        self.processor.exit()
+        for suffix in ('', '.journal', '.idx'):
+            if os.path.exists(self.test_tar_path + suffix):
+                os.remove(self.test_tar_path + suffix)
+
+    def test_navigate_compressed_archive(self):
+        self.assertEqual(self.processor.get_prompt(), "user@computer:/$ ")
+        self.processor.cd('home')
+        self.assertEqual(self.processor.ls(), "blob.bin\nolya\ntest_file.txt\n")
+        self.assertEqual(self.processor.cat('test_file.txt'), "Hello, World!\n")
+
+    def test_sync_keeps_compression(self):
+        self.processor.rmdir('home/olya')
+        self.assertEqual(self.processor.sync(), "")
+        self.assertEqual(archive.detect_compression(self.test_tar_path), 'gz')
+        self.assertEqual(self.processor.cat('home/test_file.txt'), "Hello, World!\n")
+
+        with tarfile.open(self.test_tar_path, 'r:gz') as tar:
+            self.assertNotIn('test_fs/home/olya', tar.getnames())
+
+    def test_checkpoint_reader_random_access(self):
+        with open(self.test_tar_path, 'rb') as raw:
+            expected = gzip.decompress(raw.read())
+        reader = GzipCheckpointReader(open(self.test_tar_path, 'rb'), spacing=16384)
+        self.assertEqual(reader.read(), expected)
+        self.assertTrue(reader.checkpoints)
+
+        for offset in (len(expected) - 700, 20000, 0, 150000):
+            reader.seek(offset)
+            self.assertEqual(reader.read(1000), expected[offset:offset + 1000])
+        reader.close()
+
+    def test_stream_readers_random_access(self):
+        expected = b"".join(b"line %06d %s\n" % (i, b"x" * (i % 80)) for i in range(5000))
+        formats = [
+            (bz2.BZ2Compressor, Bz2CheckpointReader, bz2.decompress),
+            (lambda: lzma.LZMACompressor(lzma.FORMAT_XZ), XzBlockReader, lzma.decompress),
+        ]
+        for new_compressor, reader_class, decompress in formats:
+            raw = BytesIO()
+            writer = ChunkedStreamWriter(raw, new_compressor, size=50000)
+            writer.write(expected)
+            writer.close()
+            # Concatenated streams are an ordinary file for any other reader
+            self.assertEqual(decompress(raw.getvalue()), expected)
+
+            reader = reader_class(BytesIO(raw.getvalue()))
+            self.assertEqual(reader.read(), expected)
+            for offset in (len(expected) - 700, 20000, 0, 150000, 49999, 50000):
+                reader.seek(offset)
+                self.assertEqual(reader.read(1000), expected[offset:offset + 1000])
+            # One checkpoint or block per stream written
+            starts = reader.checkpoint_offsets if reader_class is Bz2CheckpointReader else reader.block_offsets
+            self.assertEqual(starts, list(range(0, len(expected), 50000)))
+            reader.close()
+
+    def test_single_block_xz_warns(self):
+        path = 'single_block.tar.xz'
+        with open(path, 'wb') as f:
+            f.write(lzma.compress(bytes(5 * 1024 * 1024)))
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                archive.open_data(path, 'xz').close()
+            self.assertEqual([warning.category for warning in caught], [RuntimeWarning])
+        finally:
+            os.remove(path)
+
+    def test_sync_keeps_xz_seekable(self):
+        path = 'test_fs.tar.xz'
+        with tarfile.open(self.test_tar_path, 'r:gz') as source, tarfile.open(path, 'w:xz') as tar:
+            for member in source:
+                tar.addfile(member, source.extractfile(member) if member.isfile() else None)
+        processor = CommandProcessor('user', 'computer', path)
+        try:
+            processor.rmdir('home/olya')
+            self.assertEqual(processor.sync(), "")
+            self.assertIsInstance(processor.image.backend.fileobj, XzBlockReader)
+            self.assertEqual(processor.cat('home/test_file.txt'), "Hello, World!\n")
+            with tarfile.open(path, 'r:xz') as tar:
+                self.assertNotIn('test_fs/home/olya', tar.getnames())
+        finally:
+            processor.exit()
+            for suffix in ('', '.journal', '.idx'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
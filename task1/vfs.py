@@ -0,0 +1,244 @@
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+import zipfile
+import archive
+from archive import Entry
+
+# Every backend exposes the same small surface to ArchiveImage:
+#   path, root         where the image lives and the name of its top directory
+#   entries()          Entry records, directories before their contents
+#   read(entry, offset, size)
+#   compact(overlay)   write the overlay's removals back to the image
+#   closed, close()
+
+
+class TarBackend:
+    def __init__(self, path):
+        self.path = path
+        self.root = archive.root_name(path)
+        self.compression = archive.detect_compression(path)
+        self.fileobj = archive.open_data(path, self.compression)
+
+        # Members in archive order, and where the end-of-archive marker starts.
+        # A fresh sidecar index saves walking every header in the archive.
+        self.sidecar_path = path + '.idx'
+        loaded = archive.load_sidecar(self.sidecar_path, path)
+        if loaded is not None:
+            self.members, self.end_offset = loaded
+        else:
+            self.members, self.end_offset = archive.scan_members(self.fileobj)
+            self._save_sidecar()
+
+    def _save_sidecar(self):
+        try:
+            archive.save_sidecar(self.sidecar_path, self.path, self.members, self.end_offset)
+        except OSError:
+            # The sidecar is only a startup cache; a read-only location is fine
+            pass
+
+    def entries(self):
+        return self.members
+
+    def read(self, entry, offset, size):
+        self.fileobj.seek(entry.offset_data + offset)
+        return self.fileobj.read(size)
+
+    def compact(self, overlay):
+        try:
+            self.members, self.end_offset = archive.rewrite_archive(
+                self.path,
+                self.fileobj,
+                self.members,
+                self.end_offset,
+                lambda member: not overlay.is_removed(member.name.rstrip('/')),
+                before_replace=self.fileobj.close,
+                compression=self.compression
+            )
+        finally:
+            # Kept members already know their new offsets, so there is no need to rescan
+            if self.fileobj.closed:
+                self.fileobj = archive.open_data(self.path, self.compression)
+        self._save_sidecar()
+
+    @property
+    def closed(self):
+        return self.fileobj.closed
+
+    def close(self):
+        self.fileobj.close()
+
+
+class ZipBackend:
+    def __init__(self, path):
+        self.path = path
+        self.root = os.path.splitext(os.path.basename(path))[0]
+        self.zip = zipfile.ZipFile(path)
+        self._load()
+
+    def _load(self):
+        self.members = []
+        self.infos = {}
+        for info in self.zip.infolist():
+            name = info.filename.rstrip('/')
+            member_type = tarfile.DIRTYPE if info.is_dir() else tarfile.REGTYPE
+            self.members.append(Entry(name, member_type, info.file_size, info.header_offset, info.header_offset))
+            self.infos[name] = info
+        # Sequential reads of one member keep its decompressor open
+        self.open_name = None
+        self.open_file = None
+
+    def entries(self):
+        return self.members
+
+    def read(self, entry, offset, size):
+        if self.open_name != entry.name or self.open_file.tell() > offset:
+            self._close_member()
+            self.open_file = self.zip.open(self.infos[entry.name])
+            self.open_name = entry.name
+        self.open_file.seek(offset)
+        return self.open_file.read(size)
+
+    def _close_member(self):
+        if self.open_file is not None:
+            self.open_file.close()
+        self.open_name = None
+        self.open_file = None
+
+    def compact(self, overlay):
+        # Zip has no raw-copy API, so kept members are recompressed as they stream over
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.zip.tmp')
+        kept = [entry for entry in self.members if not overlay.is_removed(entry.name)]
+        try:
+            with os.fdopen(descriptor, 'wb') as raw, zipfile.ZipFile(raw, 'w') as destination:
+                for entry in kept:
+                    info = self.infos[entry.name]
+                    if info.is_dir():
+                        destination.writestr(info, b'')
+                        continue
+                    with self.zip.open(info) as source, destination.open(info, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as target:
+                        shutil.copyfileobj(source, target, archive.COPY_BUFSIZE)
+            self.close()
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            if self.closed:
+                self.zip = zipfile.ZipFile(self.path)
+
+        # Keep the same Entry objects, which the directory index points at
+        moved = {entry.name: entry for entry in kept}
+        self._load()
+        for position, entry in enumerate(self.members):
+            original = moved[entry.name]
+            original.offset = original.offset_data = entry.offset
+            self.members[position] = original
+
+    @property
+    def closed(self):
+        return self.zip.fp is None
+
+    def close(self):
+        self._close_member()
+        self.zip.close()
+
+
+class DirBackend:
+    # A plain directory tree on disk; rmdir removes directories for real on compaction
+    def __init__(self, path):
+        self.path = os.path.normpath(path)
+        self.root = os.path.basename(self.path)
+        self.parent = os.path.dirname(self.path)
+        self.members = []
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            dirnames.sort()
+            name = os.path.relpath(dirpath, self.parent).replace("\\", "/")
+            self.members.append(Entry(name, tarfile.DIRTYPE, 0, 0, len(self.members)))
+            for filename in sorted(filenames):
+                info = os.lstat(os.path.join(dirpath, filename))
+                member_type = tarfile.REGTYPE if stat.S_ISREG(info.st_mode) else tarfile.SYMTYPE
+                self.members.append(Entry(name + '/' + filename, member_type, info.st_size, 0, len(self.members)))
+        self.open_name = None
+        self.open_file = None
+        self.is_closed = False
+
+    def entries(self):
+        return self.members
+
+    def read(self, entry, offset, size):
+        if self.open_name != entry.name:
+            self._close_member()
+            self.open_file = open(os.path.join(self.parent, entry.name), 'rb')
+            self.open_name = entry.name
+        self.open_file.seek(offset)
+        return self.open_file.read(size)
+
+    def _close_member(self):
+        if self.open_file is not None:
+            self.open_file.close()
+        self.open_name = None
+        self.open_file = None
+
+    def compact(self, overlay):
+        self._close_member()
+        for path in sorted(overlay.removed):
+            full_path = os.path.join(self.parent, path)
+            if os.path.isdir(full_path):
+                shutil.rmtree(full_path)
+        self.members = [entry for entry in self.members if not overlay.is_removed(entry.name)]
+
+    @property
+    def closed(self):
+        return self.is_closed
+
+    def close(self):
+        self._close_member()
+        self.is_closed = True
+
+
+class MemoryBackend:
+    # Files held in a dict of path -> bytes (None for a directory), relative to root
+    def __init__(self, files, root='fs'):
+        self.path = None
+        self.root = root
+        self.data = {}
+        self.members = [Entry(root, tarfile.DIRTYPE)]
+        for name, content in files.items():
+            full_name = root + '/' + name.strip('/')
+            if content is None:
+                self.members.append(Entry(full_name, tarfile.DIRTYPE, 0, 0, len(self.members)))
+            else:
+                self.data[full_name] = bytes(content)
+                self.members.append(Entry(full_name, tarfile.REGTYPE, len(content), 0, len(self.members)))
+        self.is_closed = False
+
+    def entries(self):
+        return self.members
+
+    def read(self, entry, offset, size):
+        return self.data[entry.name][offset:offset + size]
+
+    def compact(self, overlay):
+        self.members = [entry for entry in self.members if not overlay.is_removed(entry.name)]
+        for name in [name for name in self.data if overlay.is_removed(name)]:
+            del self.data[name]
+
+    @property
+    def closed(self):
+        return self.is_closed
+
+    def close(self):
+        self.is_closed = True
+
+
+def open_backend(path):
+    if os.path.isdir(path):
+        return DirBackend(path)
+    if zipfile.is_zipfile(path) and not archive.detect_compression(path):
+        return ZipBackend(path)
+    return TarBackend(path)
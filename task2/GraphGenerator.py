@@ -4,120 +4,198 @@ import sys
 import os
 import argparse
 from subprocess import DEVNULL
+import sources
+import writers
+from events import EventLog, profiler
+from evaluator import Evaluator, split_extras
 
 class GraphGenerator:
-    def __init__(self, output_path, max_depth):
+    def __init__(self, output_path, max_depth, source=None, output_format='mermaid', evaluator=None, events=None):
         self.output_path = os.path.normpath(output_path)
         self.max_depth = max_depth
+        self.output_format = output_format
+        # Set while generating; edges are written as soon as they are found
+        self.writer = None
         self.dependencies = set()
-        self.installed_packages = set()
-        self._refresh_installed_packages()
+        # (normalized name, extras) -> most remaining depth it has been expanded with
+        self.expanded = {}
+        self.expansions = 0
+        self.saved_expansions = 0
+        # normalized name -> Requires-Dist entries, and (name, extras) -> what applies of them
+        self.requirement_lists = {}
+        self.dependency_lists = {}
+        # Requirement lists actually read from the source
+        self.lookups = 0
+        # Markers are evaluated for this interpreter unless a target environment is given
+        self.evaluator = evaluator if evaluator is not None else Evaluator()
+        # Installed distributions' metadata unless told otherwise (see sources.py)
+        self.source = source if source is not None else sources.InstalledSource()
+        # Progress is reported as structured events (see events.py)
+        self.events = events if events is not None else EventLog()
+        self.events.info("installed_packages", count=len(self.source.installed))
         self.success = False
 
+    @property
+    def installed_packages(self):
+        return self.source.installed
+
     def _refresh_installed_packages(self):
-        self.log("Refreshing list of installed packages")
-        try:
-            result = subprocess.run(
-                [sys.executable, '-m', 'pip', 'list'],
-                capture_output=True,
-                text=True
-            )
-            if result.returncode != 0:
-                self.log("Failed to get list of installed packages")
-                self.log(result)
-                return
-                
-            self.installed_packages = {
-                line.split()[0].lower() 
-                for line in result.stdout.split('\n')[2:] 
-                if line
-            }
-            self.log(f"Found {len(self.installed_packages)} installed packages")
-        except subprocess.SubprocessError:
-            self.log("Failed to refresh installed packages list")
-
-    def log(self, message):
-        print(f"{message}")
+        self.source.refresh()
+        self.events.debug("installed_packages", count=len(self.source.installed))
 
     def is_package_installed(self, package):
-        self.log(f"Checking if package is installed: {package}")
-        is_installed = package.lower() in self.installed_packages
-        self.log(f"Package {package} is {'installed' if is_installed else 'not installed'}")
+        is_installed = self.source.is_installed(package)
+        self.events.debug("installed_check", package=package, installed=is_installed)
         return is_installed
-    
+
     def install_package(self, package):
-        self.log(f"Installing package: {package}")
+        if not self.source.can_install:
+            self.events.warning("not_available", package=package)
+            return False
+        self.events.info("install", packages=[package])
         try:
-            subprocess.check_call(
-                [sys.executable, '-m', 'pip', 'install', package],
-                stdout=DEVNULL,
-                stderr=DEVNULL
-            )
-            self.log(f"Successfully installed {package}")
+            with profiler.phase('subprocess'):
+                subprocess.check_call(
+                    [sys.executable, '-m', 'pip', 'install', package],
+                    stdout=DEVNULL,
+                    stderr=DEVNULL
+                )
+            self.events.info("installed", packages=[package])
             self._refresh_installed_packages()  # Update cache after installation
             return True
         except subprocess.CalledProcessError:
-            self.log(f"Failed to install {package}")
+            self.events.warning("install_failed", package=package)
             return False
 
     def get_package_info(self, package):
-        self.log(f"Getting info for package: {package}")
-        try:
-            result = subprocess.check_output(
-                [sys.executable, '-m', 'pip', 'show', package],
-                stderr=DEVNULL
-            )
-            return result.decode('utf-8')
-        except subprocess.CalledProcessError:
-            self.log(f"Failed to get info for {package}")
-            return None
+        package_info = sources.pip_show(package)
+        if package_info is None:
+            self.events.warning("no_metadata", package=package)
+        return package_info
 
     def parse_dependencies(self, package_info):
-        if not package_info:
+        dependencies = sources.parse_requires(package_info)
+        return dependencies
+
+    def get_requirements(self, package):
+        key = sources.normalize_name(package)
+        if key not in self.requirement_lists:
+            self.requirement_lists[key] = self._read_requirements(package)
+        return self.requirement_lists[key]
+
+    def _read_requirements(self, package):
+        self.lookups += 1
+        requirements = self.source.requirements(package)
+        if requirements is None:
+            self.events.warning("no_metadata", package=package)
             return []
-        
-        for line in package_info.split('\n'):
-            if line.startswith('Requires:'):
-                deps = line.replace('Requires:', '').strip()
-                dependencies = [dep.strip() for dep in deps.split(',') if dep.strip()]
-                self.log(f"Found dependencies: {', '.join(dependencies) if dependencies else 'none'}")
-                return dependencies
-        return []
+        return requirements
+
+    def get_dependencies(self, package, extras=()):
+        # (name, extras) of the requirements that apply in the target environment
+        key = (sources.normalize_name(package), extras)
+        if key not in self.dependency_lists:
+            dependencies = self.evaluator.requirements(self.get_requirements(package), extras)
+            if self.events.enabled('debug'):
+                self.events.debug("dependencies", package=package, extras=extras, found=[name for name, _ in dependencies])
+            self.dependency_lists[key] = dependencies
+        return self.dependency_lists[key]
+
+    def install_packages(self, packages):
+        # One pip install for the whole batch; if that fails, one at a time to
+        # find out which of them are missing. Returns the names now installed.
+        packages = list(dict.fromkeys(packages))
+        if len(packages) <= 1 or not self.source.can_install:
+            return {package for package in packages if self.install_package(package)}
+        self.events.info("install", packages=packages)
+        try:
+            with profiler.phase('subprocess'):
+                subprocess.check_call(
+                    [sys.executable, '-m', 'pip', 'install', *packages],
+                    stdout=DEVNULL,
+                    stderr=DEVNULL
+                )
+            self.events.info("installed", packages=packages)
+            self._refresh_installed_packages()
+            return set(packages)
+        except subprocess.CalledProcessError:
+            return {package for package in packages if self.install_package(package)}
 
     def build_dependency_tree(self, package, current_depth=0):
-        if current_depth >= self.max_depth:
-            self.log(f"Reached max depth {self.max_depth} for {package}")
-            return
-
-        self.log(f"Building dependency tree for {package} (depth: {current_depth})")
-        package_info = self.get_package_info(package)
-        dependencies = self.parse_dependencies(package_info)
-
-        for dep in dependencies:
-            if dep:
-                self.dependencies.add(f"{package} --> {dep}")
-                if not self.is_package_installed(dep):
-                    if not self.install_package(dep):
-                        continue
-                self.build_dependency_tree(dep, current_depth + 1)
+        # Breadth-first, one level at a time: a whole level's metadata is
+        # requested up front, so a slow source can fetch it concurrently.
+        # A package is expanded separately for each set of extras it is asked with.
+        frontier = [split_extras(package)]
+        while frontier:
+            if current_depth >= self.max_depth:
+                if self.events.enabled('debug'):
+                    self.events.debug("max_depth", depth=self.max_depth, packages=[name for name, _ in frontier])
+                return
+
+            # A package already expanded with at least this much depth left adds no new edges
+            remaining = self.max_depth - current_depth
+            level = []
+            for name, extras in frontier:
+                key = (sources.normalize_name(name), extras)
+                if self.expanded.get(key, 0) >= remaining:
+                    self.saved_expansions += 1
+                    continue
+                self.expanded[key] = remaining
+                self.expansions += 1
+                level.append((name, extras))
+            self.source.prefetch([name for name, _ in level if sources.normalize_name(name) not in self.requirement_lists])
+
+            next_frontier = []
+            missing = []
+            self.events.debug("level", depth=current_depth, packages=len(level))
+            for name, extras in level:
+                for dep, dep_extras in self.get_dependencies(name, extras):
+                    edge = f"{name} --> {dep}"
+                    if edge not in self.dependencies:
+                        self.dependencies.add(edge)
+                        if self.writer is not None:
+                            with profiler.phase('output'):
+                                self.writer.write_edge(name, dep)
+                    next_frontier.append((dep, dep_extras))
+                    if not self.is_package_installed(dep):
+                        missing.append(dep)
+            if missing:
+                installed = self.install_packages(missing)
+                failed = {sources.normalize_name(dep) for dep in missing if dep not in installed}
+                next_frontier = [item for item in next_frontier if sources.normalize_name(item[0]) not in failed]
+
+            frontier = next_frontier
+            current_depth += 1
 
     def generate_mermaid(self, package):
-        self.log(f"Starting graph generation for {package}")
-        if not self.is_package_installed(package):
-            if not self.install_package(package):
-                self.log(f"Failed to install {package}. Cannot generate dependency graph.")
+        self.events.info("start", package=package, max_depth=self.max_depth)
+        name, _ = split_extras(package)
+        if not self.is_package_installed(name):
+            if not self.install_package(name):
+                self.events.error("not_installed", package=package)
                 self.success = False
                 return False
 
-        mermaid_text = "graph TD\n"
-        self.build_dependency_tree(package)
-        
-        self.log(f"Writing graph with {len(self.dependencies)} dependencies")
-        for dep in sorted(self.dependencies):
-            mermaid_text += f"    {dep}\n"
+        self.writer = writers.WRITERS[self.output_format](self.output_path)
+        try:
+            with profiler.phase('traversal'):
+                self.build_dependency_tree(package)
+        except BaseException:
+            self.writer.abort()
+            raise
+        finally:
+            writer, self.writer = self.writer, None
+        self.events.info("traversed", expansions=self.expansions, saved_expansions=self.saved_expansions, lookups=self.lookups)
+        profiler.count('expansions', self.expansions)
+        profiler.count('saved_expansions', self.saved_expansions)
+        profiler.count('lookups', self.lookups)
+        profiler.count('edges', len(self.dependencies))
 
-        with open(self.output_path, 'w') as f:
-            f.write(mermaid_text)
-        self.log(f"Graph saved to {self.output_path}")
+        with profiler.phase('output'):
+            writer.close()
+        self.events.info("saved", path=self.output_path, edges=len(self.dependencies))
         self.success = True
-        return True
\ No newline at end of file
+        return True
+
+    def close(self):
+        self.source.close()
\ No newline at end of file
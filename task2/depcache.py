@@ -0,0 +1,95 @@
+import json
+import os
+import sqlite3
+import sources
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requirements (
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    stamp TEXT NOT NULL,
+    requires TEXT NOT NULL,
+    PRIMARY KEY (name, version)
+) WITHOUT ROWID
+"""
+
+
+class CachedSource:
+    # Wraps another source and keeps its requirement lists in an SQLite file,
+    # keyed by (name, version). A row is used only while the stamp of the
+    # metadata it was read from is unchanged. Stamps are content digests, so
+    # environments sharing the file reuse each other's rows.
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        # Several runs may share one cache file
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def installed(self):
+        return self.source.installed
+
+    @property
+    def can_install(self):
+        return self.source.can_install
+
+    def refresh(self):
+        self.source.refresh()
+
+    def is_installed(self, name):
+        return self.source.is_installed(name)
+
+    def fingerprint(self, name):
+        return self.source.fingerprint(name)
+
+    def _fresh(self, name):
+        fingerprint = self.source.fingerprint(name)
+        if fingerprint is None:
+            return False
+        row = self.connection.execute(
+            "SELECT stamp FROM requirements WHERE name = ? AND version = ?",
+            (sources.normalize_name(name), fingerprint[0])
+        ).fetchone()
+        return row is not None and row[0] == fingerprint[1]
+
+    def prefetch(self, names):
+        # Only what the cache cannot answer goes to the wrapped source
+        self.source.prefetch([name for name in names if not self._fresh(name)])
+
+    def requirements(self, name):
+        fingerprint = self.source.fingerprint(name)
+        if fingerprint is None:
+            self.misses += 1
+            return self.source.requirements(name)
+
+        key = sources.normalize_name(name)
+        version, stamp = fingerprint
+        row = self.connection.execute(
+            "SELECT stamp, requires FROM requirements WHERE name = ? AND version = ?",
+            (key, version)
+        ).fetchone()
+        if row is not None and row[0] == stamp:
+            self.hits += 1
+            return json.loads(row[1])
+
+        self.misses += 1
+        requirements = self.source.requirements(name)
+        if requirements is not None:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO requirements VALUES (?, ?, ?, ?)",
+                (key, version, stamp, json.dumps(requirements))
+            )
+        return requirements
+
+    def close(self):
+        # New rows are written in one transaction at the end of the run
+        self.connection.commit()
+        self.connection.close()
+        self.source.close()
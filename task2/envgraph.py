@@ -0,0 +1,123 @@
+from array import array
+import sources
+from evaluator import Evaluator, split_extras
+
+
+class DependencyGraph:
+    # The dependency graph of every distribution a source knows, built once.
+    # Nodes are numbered; node i's edges are targets[offsets[i]:offsets[i + 1]].
+    # A node's edges are those that apply with every extra it is requested
+    # with anywhere in the environment, so queries also follow what extras
+    # pull in. The raw Requires-Dist entries are kept too: as a source (see
+    # sources.py) the graph hands them out and GraphGenerator evaluates them
+    # for the extras of each path, with no further metadata reads.
+    can_install = False
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.offsets = array('L', [0])
+        self.targets = array('L')
+        self.installed = set()
+        # Requires-Dist entries of installed node i
+        self.requires = []
+        self.evaluator = None
+
+    def _node(self, name):
+        key = sources.normalize_name(name)
+        number = self.index.get(key)
+        if number is None:
+            number = len(self.names)
+            self.names.append(key)
+            self.index[key] = number
+        return number
+
+    @classmethod
+    def build(cls, source, evaluator=None, roots=()):
+        # roots: packages, possibly with extras, that queries will start from
+        evaluator = evaluator if evaluator is not None else Evaluator()
+        graph = cls()
+        graph.evaluator = evaluator
+        names = sorted(source.installed)
+        source.prefetch(names)
+        # Installed distributions come first, so their numbers follow `names`
+        for name in names:
+            graph._node(name)
+        graph.requires = [source.requirements(name) or [] for name in names]
+
+        # Extras each installed package is requested with, until nothing new turns up
+        requested = [set() for _ in names]
+        for root in roots:
+            name, extras = split_extras(root)
+            node = graph.index.get(sources.normalize_name(name))
+            if node is not None and node < len(names):
+                requested[node].update(extras)
+        pending = list(range(len(names)))
+        while pending:
+            node = pending.pop()
+            for dep, dep_extras in evaluator.requirements(graph.requires[node], tuple(sorted(requested[node]))):
+                target = graph.index.get(sources.normalize_name(dep))
+                if target is not None and target < len(names) and not requested[target].issuperset(dep_extras):
+                    requested[target].update(dep_extras)
+                    pending.append(target)
+
+        for node in range(len(names)):
+            for dep in evaluator.names(graph.requires[node], tuple(sorted(requested[node]))):
+                graph.targets.append(graph._node(dep))
+            graph.offsets.append(len(graph.targets))
+        # Requirements that are not installed are nodes without edges
+        graph.offsets.extend([len(graph.targets)] * (len(graph.names) - len(names)))
+        graph.installed = set(names)
+        return graph
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def subgraph(self, root, max_depth):
+        # Edges within max_depth of root, labelled and expanded per extras the way
+        # GraphGenerator does it
+        edges = set()
+        name, extras = split_extras(root)
+        start = self.index.get(sources.normalize_name(name))
+        if start is None:
+            return edges
+        expanded = set()
+        frontier = [(start, name, extras)]
+        depth = 0
+        while frontier and depth < max_depth:
+            next_frontier = []
+            for node, label, extras in frontier:
+                if (node, extras) in expanded or node >= len(self.requires):
+                    continue
+                expanded.add((node, extras))
+                for dep, dep_extras in self.evaluator.requirements(self.requires[node], extras):
+                    edges.add(f"{label} --> {dep}")
+                    # Extras the graph was not built with may name a package it has never seen
+                    target = self.index.get(sources.normalize_name(dep))
+                    if target is not None:
+                        next_frontier.append((target, dep, dep_extras))
+            frontier = next_frontier
+            depth += 1
+        return edges
+
+    def refresh(self):
+        pass
+
+    def is_installed(self, name):
+        return sources.normalize_name(name) in self.installed
+
+    def fingerprint(self, name):
+        return None
+
+    def prefetch(self, names):
+        pass
+
+    def requirements(self, name):
+        node = self.index.get(sources.normalize_name(name))
+        if node is None or node >= len(self.requires):
+            return None
+        return self.requires[node]
+
+    def close(self):
+        pass
@@ -0,0 +1,86 @@
+try:
+    from packaging.markers import default_environment
+    from packaging.requirements import Requirement, InvalidRequirement
+except ImportError:
+    # pip always carries its own copy
+    from pip._vendor.packaging.markers import default_environment
+    from pip._vendor.packaging.requirements import Requirement, InvalidRequirement
+
+from events import profiler
+
+# Marker variables that follow from the platform name
+PLATFORMS = {
+    'linux': {'sys_platform': 'linux', 'platform_system': 'Linux', 'os_name': 'posix'},
+    'win32': {'sys_platform': 'win32', 'platform_system': 'Windows', 'os_name': 'nt'},
+    'darwin': {'sys_platform': 'darwin', 'platform_system': 'Darwin', 'os_name': 'posix'},
+}
+
+
+def target_environment(python_version=None, platform=None):
+    # Marker environment of this interpreter with the given parts replaced
+    environment = default_environment()
+    if python_version:
+        environment['python_version'] = '.'.join(python_version.split('.')[:2])
+        environment['python_full_version'] = python_version if python_version.count('.') >= 2 else python_version + '.0'
+    if platform:
+        environment.update(PLATFORMS[platform])
+    return environment
+
+
+class Evaluator:
+    # Decides which Requires-Dist entries apply in a target environment with a
+    # given set of extras. Parsed requirements and marker results are memoized:
+    # the same few markers (python_version, sys_platform, extra == ...) recur
+    # across almost every package.
+    def __init__(self, environment=None):
+        self.environment = environment if environment is not None else default_environment()
+        self.parsed = {}
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, line):
+        if line not in self.parsed:
+            try:
+                self.parsed[line] = Requirement(line)
+            except InvalidRequirement:
+                self.parsed[line] = None
+        return self.parsed[line]
+
+    def marker_holds(self, marker, extra):
+        key = (str(marker), extra)
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            result = self.results[key] = marker.evaluate(dict(self.environment, extra=extra))
+        else:
+            self.hits += 1
+        return result
+
+    def applies(self, requirement, extras=()):
+        if requirement.marker is None:
+            return True
+        return any(self.marker_holds(requirement.marker, extra) for extra in ('', *extras))
+
+    def requirements(self, lines, extras=()):
+        # (name, extras) of each requirement that applies, in metadata order;
+        # a name listed twice keeps the union of its extras
+        found = {}
+        with profiler.phase('metadata'):
+            for line in lines or ():
+                requirement = self.parse(line)
+                if requirement is None or not self.applies(requirement, extras):
+                    continue
+                found.setdefault(requirement.name, set()).update(requirement.extras)
+        return [(name, tuple(sorted(requirement_extras))) for name, requirement_extras in found.items()]
+
+    def names(self, lines, extras=()):
+        return [name for name, _ in self.requirements(lines, extras)]
+
+
+def split_extras(package):
+    # "name[extra1,extra2]" -> ("name", ("extra1", "extra2"))
+    if '[' not in package:
+        return package, ()
+    requirement = Requirement(package)
+    return requirement.name, tuple(sorted(requirement.extras))
@@ -0,0 +1,127 @@
+import json
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+
+class EventLog:
+    # Structured events filtered by level. Events below the level are dropped
+    # before anything is formatted; callers check enabled() first where even
+    # building the fields would cost something. Text lines read
+    # "LEVEL event key=value ..."; json gives one object per line. Events go
+    # to stderr so they never mix with the graph printed on stdout.
+    def __init__(self, level='info', stream=None, output_format='text'):
+        self.threshold = LEVELS[level]
+        self.stream = stream if stream is not None else sys.stderr
+        self.output_format = output_format
+
+    def enabled(self, level):
+        return LEVELS[level] >= self.threshold
+
+    def emit(self, level, event, **fields):
+        if LEVELS[level] < self.threshold:
+            return
+        if self.output_format == 'json':
+            line = json.dumps({"time": time.time(), "level": level, "event": event, **fields})
+        else:
+            line = " ".join([f"{level.upper():<7}", event] + [f"{key}={format_value(value)}" for key, value in fields.items()])
+        self.stream.write(line + "\n")
+
+    def debug(self, event, **fields):
+        self.emit('debug', event, **fields)
+
+    def info(self, event, **fields):
+        self.emit('info', event, **fields)
+
+    def warning(self, event, **fields):
+        self.emit('warning', event, **fields)
+
+    def error(self, event, **fields):
+        self.emit('error', event, **fields)
+
+
+def format_value(value):
+    if isinstance(value, (list, tuple, set)):
+        return ",".join(str(item) for item in value) or "-"
+    return str(value)
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+class Profiler:
+    # Wall-clock time per phase. Phases nest; a phase's "self" time excludes
+    # the phases started inside it on the same thread, so the self times of
+    # one thread add up to its total. Phases on worker threads (concurrent
+    # pip calls) are timed too, and their totals may exceed wall time.
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        # Forget everything measured so far and start the clock again
+        with self.lock:
+            self.started = time.perf_counter()
+            self.durations = {}
+            self.self_times = {}
+            self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        stack = self.local.__dict__.setdefault('stack', [])
+        # [children time] of the phase being timed
+        frame = [0.0]
+        stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self.lock:
+                self.durations.setdefault(name, []).append(elapsed)
+                self.self_times[name] = self.self_times.get(name, 0.0) + elapsed - frame[0]
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self):
+        phases = {}
+        for name, durations in self.durations.items():
+            ordered = sorted(durations)
+            phases[name] = {
+                "count": len(ordered),
+                "total_seconds": sum(ordered),
+                "self_seconds": self.self_times[name],
+                "p50_ms": percentile(ordered, 0.50) * 1000,
+                "p95_ms": percentile(ordered, 0.95) * 1000,
+                "p99_ms": percentile(ordered, 0.99) * 1000,
+                "max_ms": ordered[-1] * 1000,
+            }
+        return {
+            "total_seconds": time.perf_counter() - self.started,
+            "phases": phases,
+            "counters": dict(self.counters),
+        }
+
+
+# Shared by every module in a run; main.py enables it for --profile
+profiler = Profiler()
@@ -0,0 +1,61 @@
+import json
+import os
+import sources
+
+STATE_VERSION = 2
+
+
+class GraphState:
+    # What the previous runs read and produced, kept in one JSON file:
+    #   packages  normalized name -> fingerprint of its metadata and its Requires-Dist
+    #   graphs    "root|max_depth" -> edges of the graph generated for it
+    # A package whose fingerprint is unchanged is not read again, so a run
+    # after a small environment change only re-reads what changed, plus
+    # whatever became reachable through it.
+    def __init__(self, path):
+        self.path = path
+        self.packages = {}
+        self.graphs = {}
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+            if state.get("version") == STATE_VERSION:
+                self.packages = state["packages"]
+                self.graphs = state["graphs"]
+        except (OSError, ValueError, KeyError):
+            # No previous run, or one from an older format: start over
+            pass
+
+    def restore(self, generator):
+        # Hands the generator every stored requirement list that is still current
+        reused = 0
+        for name, record in self.packages.items():
+            fingerprint = generator.source.fingerprint(name)
+            if fingerprint is not None and list(fingerprint) == record["fingerprint"]:
+                generator.requirement_lists[name] = record["requires"]
+                reused += 1
+        return reused
+
+    def update(self, generator, root):
+        # Records this run's graph; returns (added, removed) edges against the last one
+        for name, requires in generator.requirement_lists.items():
+            fingerprint = generator.source.fingerprint(name)
+            self.packages[name] = {
+                "fingerprint": list(fingerprint) if fingerprint is not None else None,
+                "requires": requires,
+            }
+        key = f"{sources.normalize_name(root)}|{generator.max_depth}"
+        previous = set(self.graphs.get(key, ()))
+        self.graphs[key] = sorted(generator.dependencies)
+        return sorted(generator.dependencies - previous), sorted(previous - generator.dependencies)
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({"version": STATE_VERSION, "packages": self.packages, "graphs": self.graphs}, f)
+        os.replace(temp_path, self.path)
+
+
+def format_diff(added, removed):
+    lines = [f"+ {edge}" for edge in added] + [f"- {edge}" for edge in removed]
+    return "\n".join(lines) + "\n" if lines else "No changes in the graph\n"
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+
+def depths(edges):
+    # Shortest distance of every node from the roots (nodes nothing depends on).
+    # A graph that is one big cycle has no roots; its first node is used instead.
+    children = defaultdict(list)
+    has_parent = set()
+    nodes = {}
+    for source, target in edges:
+        children[source].append(target)
+        has_parent.add(target)
+        nodes.setdefault(source, None)
+        nodes.setdefault(target, None)
+    roots = [node for node in nodes if node not in has_parent] or list(nodes)[:1]
+    depth = {root: 0 for root in roots}
+    frontier = roots
+    while frontier:
+        next_frontier = []
+        for node in frontier:
+            for child in children[node]:
+                if child not in depth:
+                    depth[child] = depth[node] + 1
+                    next_frontier.append(child)
+        frontier = next_frontier
+    # Anything only reachable through a rootless cycle goes one level down
+    for node in nodes:
+        depth.setdefault(node, 1)
+    return depth
+
+
+def layered_layout(edges):
+    # Nodes sit in rows by depth. Within a row they are ordered by the mean
+    # position of their parents in the row above, a single barycenter pass,
+    # so the whole layout is linear in edges apart from sorting each row.
+    depth = depths(edges)
+    parents = defaultdict(list)
+    for source, target in edges:
+        if depth[source] < depth[target]:
+            parents[target].append(source)
+    rows = defaultdict(list)
+    for node, level in depth.items():
+        rows[level].append(node)
+
+    position = {}
+    x = {}
+    for level in sorted(rows):
+        row = rows[level]
+        def barycenter(node):
+            above = [x[parent] for parent in parents[node] if parent in x]
+            return (sum(above) / len(above) if above else 0.0, node)
+        row.sort(key=barycenter)
+        width = len(row)
+        for index, node in enumerate(row):
+            x[node] = index - (width - 1) / 2
+            position[node] = (x[node], -level)
+    return position
+
+
+def collapse_leaves(edges):
+    # Replaces the leaf dependencies of each package by one "N leaves" node
+    leaves = {target for _, target in edges} - {source for source, _ in edges}
+    kept = []
+    leaf_targets = defaultdict(list)
+    for source, target in edges:
+        if target in leaves:
+            leaf_targets[source].append(target)
+        else:
+            kept.append((source, target))
+    for source, targets in leaf_targets.items():
+        if len(targets) == 1:
+            kept.append((source, targets[0]))
+        else:
+            kept.append((source, f"{source}: {len(targets)} leaves"))
+    return kept
+
+
+def cluster_by_depth(edges, limit):
+    # Keeps at most `limit` nodes per depth; the rest of a row becomes one node
+    depth = depths(edges)
+    rows = defaultdict(list)
+    for node, level in depth.items():
+        rows[level].append(node)
+    merged = {}
+    for level, row in rows.items():
+        if len(row) > limit:
+            cluster = f"+{len(row) - limit + 1} more at depth {level}"
+            for node in sorted(row)[limit - 1:]:
+                merged[node] = cluster
+    clustered = []
+    seen = set()
+    for source, target in edges:
+        edge = (merged.get(source, source), merged.get(target, target))
+        if edge[0] != edge[1] and edge not in seen:
+            seen.add(edge)
+            clustered.append(edge)
+    return clustered
+
+
+def layout_key(edges):
+    digest = hashlib.sha1()
+    for source, target in sorted(edges):
+        digest.update(f"{source}\0{target}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cached_layout(edges, cache_path):
+    # The layout of the same edges is read back instead of being recomputed
+    key = layout_key(edges)
+    try:
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            return {node: tuple(point) for node, point in cached["positions"].items()}
+    except (OSError, ValueError, KeyError):
+        pass
+    position = layered_layout(edges)
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({"key": key, "positions": position}, f)
+    os.replace(temp_path, cache_path)
+    return position
@@ -1,4 +1,14 @@
 import GraphGenerator
+import sources
+import depcache
+import envgraph
+import query
+import writers
+import incremental
+import evaluator
+import events
+import json
+import re
 import argparse
 import os
 import subprocess
@@ -11,26 +21,108 @@ def print_graph(file_path):
         print(f.read())
     print("-" * 40)
 
+def print_queries(graph_query, dependents, why, packages):
+    try:
+        if dependents:
+            print(f"Direct dependents of {dependents}: {', '.join(graph_query.dependents(dependents)) or 'none'}")
+            print(f"All dependents of {dependents}: {', '.join(graph_query.dependents(dependents, True)) or 'none'}")
+        for package in packages if why else []:
+            path = graph_query.why(package, why)
+            if path is None:
+                print(f"{package} does not depend on {why}")
+            else:
+                print(f"{package} needs {why} through: {' --> '.join(path)}")
+                print(f"{package} has {graph_query.closure_size(package)} dependencies in total")
+    except KeyError as e:
+        print(f"Unknown package: {e.args[0]}")
+
 def main():
     parser = argparse.ArgumentParser(description='Generate dependency graph in Mermaid format')
-    parser.add_argument('--output', required=True, help='Path to output Mermaid file')
-    parser.add_argument('--package', required=True, help='Package name to analyze')
+    parser.add_argument('--output', help='Path to output Mermaid file; with several packages it must contain {package}')
+    parser.add_argument('--package', default='', help='Package name to analyze, or several separated by commas')
     parser.add_argument('--max-depth', type=int, default=5, help='Maximum depth of dependency tree')
-    parser.add_argument('--repository', default='', help='Path to the repository')
+    parser.add_argument('--repository', default='', help='Directory of wheels and sdists to resolve against instead of installing')
     parser.add_argument('--vis-path', help='Path to visualization program')
+    parser.add_argument('--use-pip', action='store_true', help='Query pip in subprocesses instead of reading metadata in-process')
+    parser.add_argument('--workers', type=int, default=4, help='pip processes run at once with --use-pip')
+    parser.add_argument('--whole-env', action='store_true', help='Build the graph of every available package once and answer each package from it')
+    parser.add_argument('--dependents', help='Print the packages that depend on this one, directly and transitively')
+    parser.add_argument('--why', help='Print the shortest chain by which each --package pulls in this one')
+    parser.add_argument('--format', choices=sorted(writers.WRITERS), default='mermaid', help='Output format')
+    parser.add_argument('--state', help='JSON file with the previous run: unchanged packages are not re-read and an edge diff is printed')
+    parser.add_argument('--python-version', help='Evaluate environment markers for this Python version, e.g. 3.8')
+    parser.add_argument('--platform', choices=sorted(evaluator.PLATFORMS), help='Evaluate environment markers for this platform')
+    parser.add_argument('--cache', help='SQLite file to keep dependency lists in between runs')
+    parser.add_argument('--log-level', choices=sorted(events.LEVELS, key=events.LEVELS.get), default='info', help='Least severe progress events to print')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text', help='Print progress events as text lines or one JSON object per line')
+    parser.add_argument('--profile', help='Write time spent per phase (pip subprocesses, metadata parsing, traversal, output) as JSON to this file')
 
     args = parser.parse_args()
+    # Commas inside "name[extra1,extra2]" do not separate packages
+    packages = [package.strip() for package in re.split(r",(?![^\[]*\])", args.package) if package.strip()]
+    querying = args.dependents or args.why
+    if not querying and (not packages or not args.output):
+        parser.error("--output and --package are required")
+    if args.why and not packages:
+        parser.error("--why needs --package")
+    if not querying and len(packages) > 1 and '{package}' not in args.output:
+        parser.error("--output must contain {package} when several packages are given")
 
-    generator = GraphGenerator.GraphGenerator(args.output, args.max_depth)
-    success = generator.generate_mermaid(args.package)
-
-    if success:
-        print_graph(args.output)
-        if args.vis_path:
-            subprocess.run([sys.executable, args.vis_path, '--path', args.output])
+    event_log = events.EventLog(args.log_level, output_format=args.log_format)
+    events.profiler.enabled = bool(args.profile)
 
+    if args.repository:
+        source = sources.RepositorySource(args.repository)
+    elif args.use_pip:
+        source = sources.PipSource(args.workers)
     else:
-        print("\nFailed to generate dependency graph.")
+        source = sources.InstalledSource()
+    marker_evaluator = evaluator.Evaluator(evaluator.target_environment(args.python_version, args.platform))
+    if args.cache:
+        cache = source = depcache.CachedSource(source, args.cache)
+    if args.whole_env or querying:
+        # Every package is then answered from the one graph, with no more metadata reads
+        with events.profiler.phase('traversal'):
+            graph = envgraph.DependencyGraph.build(source, marker_evaluator, packages)
+        source.close()
+        event_log.info("environment_graph", packages=len(graph.installed), edges=graph.edge_count)
+        source = graph
+
+    if querying:
+        print_queries(query.GraphQuery(source), args.dependents, args.why, packages)
+        packages = []
+
+    state = incremental.GraphState(args.state) if args.state else None
+    try:
+        for package in packages:
+            output = args.output.replace('{package}', package)
+            generator = GraphGenerator.GraphGenerator(output, args.max_depth, source, args.format, marker_evaluator, event_log)
+            if state is not None:
+                reused = state.restore(generator)
+            success = generator.generate_mermaid(package)
+
+            if success and state is not None:
+                added, removed = state.update(generator, package)
+                event_log.info("reused", package=package, stored=reused, read=generator.lookups)
+                event_log.info("changes", package=package, added=len(added), removed=len(removed))
+                print(incremental.format_diff(added, removed), end="")
+            if success:
+                if args.format != 'binary':
+                    print_graph(output)
+                if args.vis_path:
+                    subprocess.run([sys.executable, args.vis_path, '--path', output])
+
+            else:
+                event_log.error("generation_failed", package=package)
+    finally:
+        source.close()
+        if state is not None:
+            state.save()
+    if args.cache:
+        event_log.info("metadata_cache", hits=cache.hits, misses=cache.misses)
+    if args.profile:
+        with open(args.profile, 'w') as f:
+            json.dump(events.profiler.report(), f, indent=2)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,169 @@
+from array import array
+import sources
+from evaluator import split_extras
+
+
+def reverse_adjacency(count, offsets, targets):
+    # CSR of the same graph with every edge turned around
+    incoming = [0] * (count + 1)
+    for target in targets:
+        incoming[target + 1] += 1
+    for node in range(count):
+        incoming[node + 1] += incoming[node]
+    reverse_offsets = array('L', incoming)
+    reverse_targets = array('L', bytes(reverse_offsets.itemsize * len(targets)))
+    position = incoming[:-1]
+    for node in range(count):
+        for edge in range(offsets[node], offsets[node + 1]):
+            target = targets[edge]
+            reverse_targets[position[target]] = node
+            position[target] += 1
+    return reverse_offsets, reverse_targets
+
+
+def strongly_connected(count, offsets, targets):
+    # Tarjan's algorithm without recursion. A component is emitted only after
+    # every component it can reach, i.e. sinks first.
+    index = [-1] * count
+    low = [0] * count
+    on_stack = [False] * count
+    stack = []
+    components = []
+    counter = 0
+    for root in range(count):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, offsets[root])]
+        while work:
+            node, edge = work[-1]
+            if edge < offsets[node + 1]:
+                work[-1] = (node, edge + 1)
+                target = targets[edge]
+                if index[target] == -1:
+                    index[target] = low[target] = counter
+                    counter += 1
+                    stack.append(target)
+                    on_stack[target] = True
+                    work.append((target, offsets[target]))
+                elif on_stack[target]:
+                    low[node] = min(low[node], index[target])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
+
+
+def transitive_closures(count, offsets, targets):
+    # Node -> bitset (an int) of every node reachable through at least one edge.
+    # Members of a cycle share one set, which then includes themselves.
+    closures = [0] * count
+    for component in strongly_connected(count, offsets, targets):
+        bits = 0
+        for node in component:
+            for edge in range(offsets[node], offsets[node + 1]):
+                target = targets[edge]
+                bits |= (1 << target) | closures[target]
+        for node in component:
+            closures[node] = bits
+    return closures
+
+
+def bit_members(bits):
+    members = []
+    while bits:
+        low_bit = bits & -bits
+        members.append(low_bit.bit_length() - 1)
+        bits ^= low_bit
+    return members
+
+
+class GraphQuery:
+    # Questions about an envgraph.DependencyGraph. The reverse adjacency is
+    # built up front; closures are computed on first use and then kept.
+    def __init__(self, graph):
+        self.graph = graph
+        self.count = len(graph.names)
+        self.reverse_offsets, self.reverse_targets = reverse_adjacency(self.count, graph.offsets, graph.targets)
+        self._closures = None
+        self._reverse_closures = None
+
+    def node(self, name):
+        # Extras of a "name[extra]" were already taken into account by the graph
+        node = self.graph.index.get(sources.normalize_name(split_extras(name)[0]))
+        if node is None:
+            raise KeyError(name)
+        return node
+
+    def names(self, nodes):
+        return sorted(self.graph.names[node] for node in nodes)
+
+    @property
+    def closures(self):
+        if self._closures is None:
+            self._closures = transitive_closures(self.count, self.graph.offsets, self.graph.targets)
+        return self._closures
+
+    @property
+    def reverse_closures(self):
+        if self._reverse_closures is None:
+            self._reverse_closures = transitive_closures(self.count, self.reverse_offsets, self.reverse_targets)
+        return self._reverse_closures
+
+    def dependencies(self, name, transitive=False):
+        node = self.node(name)
+        if transitive:
+            return self.names(bit_members(self.closures[node]))
+        offsets = self.graph.offsets
+        return self.names(set(self.graph.targets[offsets[node]:offsets[node + 1]]))
+
+    def dependents(self, name, transitive=False):
+        node = self.node(name)
+        if transitive:
+            return self.names(bit_members(self.reverse_closures[node]))
+        offsets = self.reverse_offsets
+        return self.names(set(self.reverse_targets[offsets[node]:offsets[node + 1]]))
+
+    def closure_size(self, name):
+        return self.closures[self.node(name)].bit_count()
+
+    def depends_on(self, name, dependency):
+        return bool(self.closures[self.node(name)] >> self.node(dependency) & 1)
+
+    def why(self, root, target):
+        # Shortest chain of requirements from root to target, or None
+        start, goal = self.node(root), self.node(target)
+        offsets, targets = self.graph.offsets, self.graph.targets
+        parent = {start: None}
+        frontier = [start]
+        while frontier and goal not in parent:
+            next_frontier = []
+            for node in frontier:
+                for edge in range(offsets[node], offsets[node + 1]):
+                    dep = targets[edge]
+                    if dep not in parent:
+                        parent[dep] = node
+                        next_frontier.append(dep)
+            frontier = next_frontier
+        if goal not in parent:
+            return None
+        path = []
+        node = goal
+        while node is not None:
+            path.append(self.graph.names[node])
+            node = parent[node]
+        return path[::-1]
@@ -0,0 +1,390 @@
+import email.parser
+import hashlib
+import importlib.metadata
+import os
+import pathlib
+import re
+import subprocess
+import sys
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import DEVNULL
+
+from evaluator import Evaluator
+from events import profiler
+
+try:
+    from packaging.version import Version, InvalidVersion
+except ImportError:
+    # pip always carries its own copy
+    from pip._vendor.packaging.version import Version, InvalidVersion
+
+# Every dependency source exposes the same small surface to GraphGenerator:
+#   refresh()           re-read which packages are available
+#   installed           set of normalized names of available packages
+#   can_install         whether missing packages may be installed with pip
+#   is_installed(name)
+#   fingerprint(name)   (version, stamp) identifying the metadata read, None if unknown;
+#                       the stamp depends only on the metadata's content
+#   prefetch(names)     hint that these are about to be asked for
+#   requirements(name)  Requires-Dist entries as written in the metadata, None if unknown;
+#                       evaluator.Evaluator decides which of them apply
+#   close()
+
+
+def normalize_name(name):
+    # PEP 503: runs of '-', '_' and '.' are equivalent, case is ignored
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def requirement_names(requires):
+    # Names of the requirements that apply here without extras, as pip show lists them
+    return Evaluator().names(requires)
+
+
+def pip_list():
+    with profiler.phase('subprocess'):
+        result = subprocess.run(
+            [sys.executable, '-m', 'pip', 'list'],
+            capture_output=True,
+            text=True
+        )
+    if result.returncode != 0:
+        return None
+    # normalized name -> version
+    return {
+        normalize_name(line.split()[0]): line.split()[1]
+        for line in result.stdout.split('\n')[2:]
+        if line
+    }
+
+
+def pip_show(package):
+    try:
+        with profiler.phase('subprocess'):
+            result = subprocess.check_output(
+                [sys.executable, '-m', 'pip', 'show', package],
+                stderr=DEVNULL
+            )
+        return result.decode('utf-8')
+    except subprocess.CalledProcessError:
+        return None
+
+
+def pip_show_many(packages):
+    # One pip process for several packages: normalized name -> its pip show block
+    with profiler.phase('subprocess'):
+        result = subprocess.run(
+            [sys.executable, '-m', 'pip', 'show', *packages],
+            capture_output=True,
+            text=True
+        )
+    found = {}
+    for block in result.stdout.split('\n---\n'):
+        for line in block.split('\n'):
+            if line.startswith('Name:'):
+                found[normalize_name(line.replace('Name:', '').strip())] = block
+                break
+    return found
+
+
+def parse_requires(package_info):
+    # Reads the "Requires:" line of pip show output
+    if not package_info:
+        return []
+    for line in package_info.split('\n'):
+        if line.startswith('Requires:'):
+            deps = line.replace('Requires:', '').strip()
+            return [dep.strip() for dep in deps.split(',') if dep.strip()]
+    return []
+
+
+def scan_distributions(paths):
+    # (normalized name, version, path) of every *.dist-info / *.egg-info on the paths
+    for entry in paths:
+        try:
+            filenames = sorted(os.listdir(entry or '.'))
+        except OSError:
+            continue
+        for filename in filenames:
+            stem, extension = os.path.splitext(filename)
+            if extension not in ('.dist-info', '.egg-info'):
+                continue
+            name, _, version = stem.partition('-')
+            # Egg names may carry a python tag after the version: NAME-VERSION-py3.11
+            yield normalize_name(name), version.partition('-')[0], os.path.join(entry, filename)
+
+
+# (path, mtime, size) -> digest, so each file is hashed once per run
+_digests = {}
+
+
+def archive_stamp(path):
+    # The file name already pins name and version, so size and time are enough
+    # to notice a rebuilt archive without reading it
+    try:
+        info = os.stat(path)
+    except OSError:
+        return ""
+    return f"{os.path.basename(path)}:{info.st_size}:{info.st_mtime_ns}"
+
+
+def metadata_stamp(path):
+    # Digest of an installed distribution's metadata: the same distribution
+    # installed in several environments (each with its own file times) gets
+    # the same stamp. An egg-info may be a single PKG-INFO file.
+    for filename in ('METADATA', 'PKG-INFO', ''):
+        file_path = os.path.join(path, filename) if filename else path
+        try:
+            info = os.stat(file_path)
+            key = (file_path, info.st_mtime_ns, info.st_size)
+            if key not in _digests:
+                digest = hashlib.sha256()
+                with open(file_path, 'rb') as f:
+                    digest.update(f.read())
+                _digests[key] = digest.hexdigest()
+            return _digests[key]
+        except (IsADirectoryError, NotADirectoryError, FileNotFoundError):
+            continue
+        except OSError:
+            return ""
+    return ""
+
+
+class InstalledSource:
+    # Reads Requires-Dist straight from the installed distributions' metadata.
+    # Only directory names are read up front; METADATA is parsed on demand.
+    can_install = True
+
+    def __init__(self, path=None):
+        self.path = path
+        self.refresh()
+
+    def refresh(self):
+        # normalized name -> (version, dist-info path)
+        self.locations = {}
+        for name, version, location in scan_distributions(sys.path if self.path is None else self.path):
+            # The first one on the path wins, as it does for imports
+            self.locations.setdefault(name, (version, location))
+        self.installed = set(self.locations)
+
+    def is_installed(self, name):
+        return normalize_name(name) in self.installed
+
+    def fingerprint(self, name):
+        # (version, stamp) that changes whenever the distribution's metadata does
+        # and is shared by identical installs in other environments
+        location = self.locations.get(normalize_name(name))
+        if location is None:
+            return None
+        version, path = location
+        return version, metadata_stamp(path)
+
+    def prefetch(self, names):
+        pass
+
+    def requirements(self, name):
+        location = self.locations.get(normalize_name(name))
+        if location is None:
+            return None
+        with profiler.phase('metadata'):
+            distribution = importlib.metadata.PathDistribution(pathlib.Path(location[1]))
+            return distribution.requires or []
+
+    def close(self):
+        pass
+
+
+class PipSource:
+    # Asks pip in subprocesses; slow, but sees exactly what pip sees. Packages
+    # are looked up several per pip show call, with a few calls in flight.
+    can_install = True
+
+    def __init__(self, workers=4, batch_size=8):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.versions = {}
+        self.installed = set()
+        self.refresh()
+
+    def refresh(self):
+        versions = pip_list()
+        if versions is not None:
+            self.versions = versions
+            self.installed = set(versions)
+        # normalized name -> dependency list, None when pip does not know it
+        self.requires = {}
+
+    def is_installed(self, name):
+        return normalize_name(name) in self.installed
+
+    def fingerprint(self, name):
+        # pip list only tells versions apart
+        version = self.versions.get(normalize_name(name))
+        return None if version is None else (version, "")
+
+    def prefetch(self, names):
+        wanted = list(dict.fromkeys(normalize_name(name) for name in names))
+        wanted = [name for name in wanted if name not in self.requires]
+        batches = [wanted[start:start + self.batch_size] for start in range(0, len(wanted), self.batch_size)]
+        if not batches:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(batches))) as pool:
+            for batch, found in zip(batches, pool.map(pip_show_many, batches)):
+                for name in batch:
+                    self.requires[name] = parse_requires(found[name]) if name in found else None
+
+    def requirements(self, name):
+        # pip has already applied markers for this interpreter, without extras
+        key = normalize_name(name)
+        if key not in self.requires:
+            self.prefetch([name])
+        return self.requires[key]
+
+    def close(self):
+        pass
+
+
+SDIST_EXTENSIONS = ('.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.zip')
+
+
+def parse_archive_name(filename):
+    # (normalized name, version, is_wheel) from a wheel or sdist file name, or None
+    if filename.endswith('.whl'):
+        # NAME-VERSION(-BUILD)?-PY-ABI-PLATFORM.whl
+        parts = filename[:-4].split('-')
+        if len(parts) < 5:
+            return None
+        return normalize_name(parts[0]), parts[1], True
+    for extension in SDIST_EXTENSIONS:
+        if filename.endswith(extension):
+            # Older sdist names may keep '-' inside the project name
+            match = re.match(r"^(.+?)-(\d[^-]*)$", filename[:-len(extension)])
+            if match is None:
+                return None
+            return normalize_name(match.group(1)), match.group(2), False
+    return None
+
+
+def version_key(version):
+    try:
+        return (1, Version(version))
+    except InvalidVersion:
+        return (0, version)
+
+
+def requires_txt_lines(text):
+    # setuptools' requires.txt: plain lines apply always, [:MARKER] sections
+    # apply under a marker and [EXTRA] sections only with that extra
+    lines = []
+    section = ""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            section = line[1:-1]
+            continue
+        extra, _, marker = section.partition(':')
+        if extra:
+            marker = f'extra == "{extra}"' + (f' and ({marker})' if marker else '')
+        lines.append(f"{line}; {marker}" if marker else line)
+    return lines
+
+
+def read_archive_requires(path):
+    # Requires-Dist of a wheel's METADATA or an sdist's PKG-INFO, without installing it
+    metadata_text = None
+    requires_text = None
+    if path.endswith('.whl'):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                parts = name.split('/')
+                if len(parts) == 2 and parts[0].endswith('.dist-info') and parts[1] == 'METADATA':
+                    metadata_text = archive.read(name).decode('utf-8', errors='replace')
+                    break
+    elif path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                parts = name.split('/')
+                if parts[-1] == 'PKG-INFO' and len(parts) == 2 and metadata_text is None:
+                    metadata_text = archive.read(name).decode('utf-8', errors='replace')
+                elif parts[-1] == 'requires.txt' and parts[-2].endswith('.egg-info') and requires_text is None:
+                    requires_text = archive.read(name).decode('utf-8', errors='replace')
+    else:
+        # Members are read in order, so stop as soon as nothing more is needed
+        # rather than decompressing the rest of the sdist
+        with tarfile.open(path) as archive:
+            for member in archive:
+                parts = member.name.split('/')
+                if parts[-1] == 'PKG-INFO' and len(parts) == 2 and metadata_text is None:
+                    metadata_text = archive.extractfile(member).read().decode('utf-8', errors='replace')
+                    if requires_text is not None or 'Requires-Dist:' in metadata_text:
+                        break
+                elif parts[-1] == 'requires.txt' and parts[-2].endswith('.egg-info') and requires_text is None:
+                    requires_text = archive.extractfile(member).read().decode('utf-8', errors='replace')
+                    if metadata_text is not None:
+                        break
+    if metadata_text is None:
+        return None
+    requires = email.parser.HeaderParser().parsestr(metadata_text).get_all('Requires-Dist')
+    if not requires and requires_text:
+        # Metadata older than 2.2 leaves the requirements to egg-info
+        requires = requires_txt_lines(requires_text)
+    return requires or []
+
+
+class RepositorySource:
+    # A local directory of wheels and sdists, read without installing anything.
+    # The newest version of each project is used, preferring a wheel.
+    can_install = False
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.refresh()
+
+    def refresh(self):
+        # normalized name -> (version, archive path)
+        self.archives = {}
+        chosen = {}
+        for filename in sorted(os.listdir(self.directory)):
+            parsed = parse_archive_name(filename)
+            if parsed is None:
+                continue
+            name, version, is_wheel = parsed
+            key = (version_key(version), is_wheel)
+            if name not in chosen or key > chosen[name]:
+                chosen[name] = key
+                self.archives[name] = (version, os.path.join(self.directory, filename))
+        self.installed = set(self.archives)
+        self.requires = {}
+
+    def is_installed(self, name):
+        return normalize_name(name) in self.installed
+
+    def fingerprint(self, name):
+        location = self.archives.get(normalize_name(name))
+        if location is None:
+            return None
+        version, path = location
+        return version, archive_stamp(path)
+
+    def prefetch(self, names):
+        pass
+
+    def requirements(self, name):
+        key = normalize_name(name)
+        location = self.archives.get(key)
+        if location is None:
+            return None
+        if key not in self.requires:
+            try:
+                with profiler.phase('metadata'):
+                    self.requires[key] = read_archive_requires(location[1])
+            except (OSError, zipfile.BadZipFile, tarfile.TarError):
+                self.requires[key] = None
+        return self.requires[key]
+
+    def close(self):
+        pass
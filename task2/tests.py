@@ -1,8 +1,58 @@
 import unittest
 import os
 import sys
+import shutil
+import tempfile
+import tarfile
+import zipfile
+from io import BytesIO, StringIO
+from contextlib import redirect_stdout, redirect_stderr
 from GraphGenerator import GraphGenerator
 import main
+import sources
+import depcache
+import envgraph
+import query
+import writers
+import layout
+import incremental
+import evaluator
+import events
+import json
+
+def write_distribution(site, name, version, requires=()):
+    # A minimal installed distribution: NAME-VERSION.dist-info/METADATA
+    dist_info = os.path.join(site, f"{name.replace('-', '_')}-{version}.dist-info")
+    os.makedirs(dist_info, exist_ok=True)
+    lines = ["Metadata-Version: 2.1", f"Name: {name}", f"Version: {version}"]
+    lines += [f"Requires-Dist: {requirement}" for requirement in requires]
+    with open(os.path.join(dist_info, 'METADATA'), 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return dist_info
+
+def metadata_text(name, version, requires=()):
+    lines = ["Metadata-Version: 2.1", f"Name: {name}", f"Version: {version}"]
+    lines += [f"Requires-Dist: {requirement}" for requirement in requires]
+    return "\n".join(lines) + "\n"
+
+def write_wheel(directory, name, version, requires=()):
+    stem = f"{name.replace('-', '_')}-{version}"
+    with zipfile.ZipFile(os.path.join(directory, f"{stem}-py3-none-any.whl"), 'w') as wheel:
+        wheel.writestr(f"{name.replace('-', '_')}/__init__.py", "")
+        wheel.writestr(f"{stem}.dist-info/METADATA", metadata_text(name, version, requires))
+
+def write_sdist(directory, name, version, requires_txt=None):
+    # Old-style sdist: PKG-INFO without Requires-Dist, requirements in egg-info
+    stem = f"{name}-{version}"
+    files = {f"{stem}/PKG-INFO": metadata_text(name, version)}
+    if requires_txt is not None:
+        files[f"{stem}/{name}.egg-info/requires.txt"] = requires_txt
+    with tarfile.open(os.path.join(directory, f"{stem}.tar.gz"), 'w:gz') as sdist:
+        for member_name, text in files.items():
+            data = text.encode()
+            info = tarfile.TarInfo(member_name)
+            info.size = len(data)
+            sdist.addfile(info, BytesIO(data))
 
 class TestAll(unittest.TestCase):
     def setUp(self):
@@ -49,5 +99,391 @@ class TestAll(unittest.TestCase):
             content = f.read()
             self.assertIn("graph TD", content)
 
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        self.site = tempfile.mkdtemp()
+        self.test_output = os.path.join(self.site, "graph.txt")
+        write_distribution(self.site, 'Top_Pkg', '1.0', ['mid.pkg (>=1)', 'leaf; python_version < "3"', 'extra-only; extra == "test"'])
+        write_distribution(self.site, 'mid-pkg', '2.0', ['Leaf>=0.1'])
+        write_distribution(self.site, 'leaf', '0.3')
+
+    def tearDown(self):
+        shutil.rmtree(self.site, ignore_errors=True)
+
+    def test_installed_source_reads_requires_dist(self):
+        source = sources.InstalledSource(path=[self.site])
+        self.assertEqual(source.installed, {'top-pkg', 'mid-pkg', 'leaf'})
+        self.assertTrue(source.is_installed('TOP.PKG'))
+        self.assertEqual(sources.requirement_names(source.requirements('top-pkg')), ['mid.pkg'])
+        self.assertEqual(sources.requirement_names(source.requirements('mid_pkg')), ['Leaf'])
+        self.assertEqual(sources.requirement_names(source.requirements('leaf')), [])
+        self.assertIsNone(source.requirements('missing'))
+
+    def test_graph_from_installed_metadata(self):
+        generator = GraphGenerator(self.test_output, 5, sources.InstalledSource(path=[self.site]))
+        self.assertTrue(generator.generate_mermaid('Top_Pkg'))
+        with open(self.test_output) as f:
+            self.assertEqual(f.read(), "graph TD\n    Top_Pkg --> mid.pkg\n    mid.pkg --> Leaf\n")
+
+    def test_output_formats(self):
+        write_distribution(self.site, 'other', '1.0', ['leaf', 'top-pkg'])
+        outputs = {}
+        for output_format in writers.WRITERS:
+            path = os.path.join(self.site, f"graph.{output_format}")
+            generator = GraphGenerator(path, 5, sources.InstalledSource(path=[self.site]), output_format)
+            self.assertTrue(generator.generate_mermaid('other'))
+            self.assertFalse(os.path.exists(path + '.tmp'))
+            outputs[output_format] = path
+
+        with open(outputs['mermaid']) as f:
+            self.assertEqual(f.read(), "graph TD\n    other --> leaf\n    other --> top-pkg\n"
+                                       "    top-pkg --> mid.pkg\n    mid.pkg --> Leaf\n")
+        with open(outputs['dot']) as f:
+            self.assertIn('    "top-pkg" -> "mid.pkg";\n', f.read())
+        self.assertEqual(writers.read_json(outputs['json']), {"other": ["leaf", "top-pkg"], "top-pkg": ["mid.pkg"],
+                                                              "mid.pkg": ["Leaf"], "leaf": [], "Leaf": []})
+        names, edges = writers.read_binary(outputs['binary'])
+        self.assertEqual([(names[a], names[b]) for a, b in edges],
+                         [('other', 'leaf'), ('other', 'top-pkg'), ('top-pkg', 'mid.pkg'), ('mid.pkg', 'Leaf')])
+
+        # x-dep is expanded again with an extra after its first edges were written
+        write_distribution(self.site, 'x-root', '1.0', ['x-dep', 'x-mid'])
+        write_distribution(self.site, 'x-mid', '1.0', ['x-dep[x]'])
+        write_distribution(self.site, 'x-dep', '1.0', ['x-e', 'x-f; extra == "x"'])
+        path = os.path.join(self.site, "extras.json")
+        generator = GraphGenerator(path, 5, sources.InstalledSource(path=[self.site]), 'json')
+        self.assertTrue(generator.generate_mermaid('x-root'))
+        self.assertEqual(writers.read_json(path), {"x-root": ["x-dep", "x-mid"], "x-mid": ["x-dep"],
+                                                   "x-dep": ["x-e", "x-f"], "x-e": [], "x-f": []})
+
+    def test_shared_dependencies_expanded_once(self):
+        write_distribution(self.site, 'diamond', '1.0', ['left', 'right', 'deep'])
+        write_distribution(self.site, 'left', '1.0', ['deep'])
+        write_distribution(self.site, 'right', '1.0', ['deep'])
+        write_distribution(self.site, 'deep', '1.0', ['deeper'])
+        write_distribution(self.site, 'deeper', '1.0', ['deepest'])
+        write_distribution(self.site, 'deepest', '1.0')
+        generator = GraphGenerator(self.test_output, 3, sources.InstalledSource(path=[self.site]))
+        self.assertTrue(generator.generate_mermaid('diamond'))
+
+        # deep is expanded once, with two levels left; left and right reach it again later
+        self.assertIn("deeper --> deepest", generator.dependencies)
+        self.assertEqual(generator.expanded[('deep', ())], 2)
+        self.assertEqual(generator.saved_expansions, 2)
+        self.assertEqual(len(generator.dependencies), 7)
+
+    def test_cache_hits_and_invalidation(self):
+        cache_path = os.path.join(self.site, 'cache', 'deps.sqlite')
+        first = depcache.CachedSource(sources.InstalledSource(path=[self.site]), cache_path)
+        self.assertEqual(sources.requirement_names(first.requirements('top-pkg')), ['mid.pkg'])
+        self.assertEqual((first.hits, first.misses), (0, 1))
+        first.close()
+
+        second = depcache.CachedSource(sources.InstalledSource(path=[self.site]), cache_path)
+        self.assertEqual(sources.requirement_names(second.requirements('Top_Pkg')), ['mid.pkg'])
+        self.assertEqual((second.hits, second.misses), (1, 0))
+
+        # Reinstalling the same version with other metadata invalidates the row
+        write_distribution(self.site, 'Top_Pkg', '1.0', ['leaf', 'mid-pkg'])
+        self.assertEqual(sources.requirement_names(second.requirements('top-pkg')), ['leaf', 'mid-pkg'])
+        self.assertEqual((second.hits, second.misses), (1, 1))
+        second.close()
+
+        # Another environment with the same distribution installed later
+        other_site = os.path.join(self.site, 'other-env')
+        dist_info = write_distribution(other_site, 'Top_Pkg', '1.0', ['leaf', 'mid-pkg'])
+        os.utime(os.path.join(dist_info, 'METADATA'), ns=(0, 0))
+        shared = depcache.CachedSource(sources.InstalledSource(path=[other_site]), cache_path)
+        self.assertEqual(sources.requirement_names(shared.requirements('top-pkg')), ['leaf', 'mid-pkg'])
+        self.assertEqual((shared.hits, shared.misses), (1, 0))
+        shared.close()
+
+    def test_whole_environment_graph(self):
+        write_distribution(self.site, 'other', '1.0', ['Mid_Pkg', 'not-installed'])
+        graph = envgraph.DependencyGraph.build(sources.InstalledSource(path=[self.site]))
+        self.assertEqual(graph.names[:4], ['leaf', 'mid-pkg', 'other', 'top-pkg'])
+        self.assertEqual(list(graph.offsets), [0, 0, 1, 3, 4, 4])
+        self.assertEqual(graph.requirements('other'), ['Mid_Pkg', 'not-installed'])
+        self.assertIsNone(graph.requirements('not-installed'))
+
+        for root in ('Top_Pkg', 'other'):
+            for depth in (1, 2, 5):
+                generator = GraphGenerator(self.test_output, depth, sources.InstalledSource(path=[self.site]))
+                generator.generate_mermaid(root)
+                self.assertEqual(graph.subgraph(root, depth), generator.dependencies)
+                from_graph = GraphGenerator(self.test_output, depth, graph)
+                from_graph.generate_mermaid(root)
+                self.assertEqual(from_graph.dependencies, generator.dependencies)
+
+    def test_whole_environment_graph_with_extras(self):
+        write_distribution(self.site, 'x-root', '1.0', ['x-dep', 'x-mid'])
+        write_distribution(self.site, 'x-mid', '1.0', ['x-dep[x]'])
+        write_distribution(self.site, 'x-dep', '1.0', ['x-e', 'x-f; extra == "x"', 'x-g; extra == "g"'])
+        write_distribution(self.site, 'x-e', '1.0', ['Top_Pkg; extra == "top"'])
+        for name in ('x-f', 'x-g'):
+            write_distribution(self.site, name, '1.0')
+        graph = envgraph.DependencyGraph.build(sources.InstalledSource(path=[self.site]), roots=['x-e[top]'])
+        for root in ('x-root', 'x-dep[g]', 'x-e[top]'):
+            generator = GraphGenerator(self.test_output, 5, sources.InstalledSource(path=[self.site]))
+            generator.generate_mermaid(root)
+            self.assertEqual(graph.subgraph(root, 5), generator.dependencies)
+            from_graph = GraphGenerator(self.test_output, 5, graph)
+            from_graph.generate_mermaid(root)
+            self.assertEqual(from_graph.dependencies, generator.dependencies)
+        self.assertIn("x-dep --> x-f", graph.subgraph('x-root', 5))
+        self.assertIn("x-dep --> x-g", graph.subgraph('x-dep[g]', 5))
+
+        # Queries follow edges that only extras pull in
+        graph_query = query.GraphQuery(graph)
+        self.assertEqual(graph_query.dependents('x-f'), ['x-dep'])
+        self.assertEqual(graph_query.dependents('x-g'), [])
+        self.assertEqual(graph_query.why('x-e[top]', 'leaf'), ['x-e', 'top-pkg', 'mid-pkg', 'leaf'])
+
+        # Extras the graph was not built for, pulling in a package that is not installed
+        write_distribution(self.site, 'x-h', '1.0', ['not-installed; extra == "more"'])
+        plain = envgraph.DependencyGraph.build(sources.InstalledSource(path=[self.site]))
+        self.assertEqual(plain.subgraph('x-h[more]', 5), {"x-h --> not-installed"})
+
+    def test_graph_queries(self):
+        # leaf <- mid-pkg <- top-pkg, plus a cycle ring-a <-> ring-b hanging off app
+        write_distribution(self.site, 'app', '1.0', ['top-pkg', 'ring-a'])
+        write_distribution(self.site, 'ring-a', '1.0', ['ring-b'])
+        write_distribution(self.site, 'ring-b', '1.0', ['ring-a', 'leaf'])
+        graph_query = query.GraphQuery(envgraph.DependencyGraph.build(sources.InstalledSource(path=[self.site])))
+
+        self.assertEqual(graph_query.dependents('leaf'), ['mid-pkg', 'ring-b'])
+        self.assertEqual(graph_query.dependents('Leaf', transitive=True), ['app', 'mid-pkg', 'ring-a', 'ring-b', 'top-pkg'])
+        self.assertEqual(graph_query.dependencies('ring-a', transitive=True), ['leaf', 'ring-a', 'ring-b'])
+        self.assertEqual(graph_query.closure_size('app'), 5)
+        self.assertTrue(graph_query.depends_on('app', 'leaf'))
+        self.assertFalse(graph_query.depends_on('leaf', 'app'))
+        self.assertEqual(graph_query.why('app', 'leaf'), ['app', 'top-pkg', 'mid-pkg', 'leaf'])
+        self.assertEqual(graph_query.why('app', 'ring-b'), ['app', 'ring-a', 'ring-b'])
+        self.assertIsNone(graph_query.why('leaf', 'app'))
+        with self.assertRaises(KeyError):
+            graph_query.dependents('missing')
+
+    def test_main_whole_environment(self):
+        output = os.path.join(self.site, "{package}.txt")
+        sys.argv[1:] = ['--output', output, '--package', 'requests,urllib3', '--whole-env', '--max-depth', '2']
+        main.main()
+        with open(os.path.join(self.site, "requests.txt")) as f:
+            self.assertIn("requests --> urllib3", f.read())
+        self.assertTrue(os.path.exists(os.path.join(self.site, "urllib3.txt")))
+
+    def test_main_events_on_stderr(self):
+        output = os.path.join(self.site, "graph.txt")
+        sys.argv[1:] = ['--output', output, '--package', 'requests', '--whole-env', '--max-depth', '1',
+                        '--cache', os.path.join(self.site, 'cache.json'), '--log-format', 'json']
+        stdout, stderr = StringIO(), StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            main.main()
+        logged = [json.loads(line) for line in stderr.getvalue().splitlines()]
+        self.assertEqual([line["event"] for line in logged if line["event"] in ("environment_graph", "metadata_cache")],
+                         ["environment_graph", "metadata_cache"])
+        self.assertIn("requests --> urllib3", stdout.getvalue())
+        self.assertNotIn('"event"', stdout.getvalue())
+
+    def test_incremental_regeneration(self):
+        state_path = os.path.join(self.site, 'state.json')
+        state = incremental.GraphState(state_path)
+        generator = GraphGenerator(self.test_output, 5, sources.InstalledSource(path=[self.site]))
+        self.assertEqual(state.restore(generator), 0)
+        generator.generate_mermaid('Top_Pkg')
+        self.assertEqual(state.update(generator, 'Top_Pkg'), (["Top_Pkg --> mid.pkg", "mid.pkg --> Leaf"], []))
+        state.save()
+
+        # Upgrade mid-pkg in place: it now needs a new package instead of leaf
+        shutil.rmtree(os.path.join(self.site, 'mid_pkg-2.0.dist-info'))
+        write_distribution(self.site, 'mid-pkg', '2.1', ['fresh'])
+        write_distribution(self.site, 'fresh', '1.0')
+
+        state = incremental.GraphState(state_path)
+        generator = GraphGenerator(self.test_output, 5, sources.InstalledSource(path=[self.site]))
+        self.assertEqual(state.restore(generator), 2)
+        generator.generate_mermaid('Top_Pkg')
+        self.assertEqual(generator.lookups, 2)
+        self.assertEqual(state.update(generator, 'Top_Pkg'), (["mid.pkg --> fresh"], ["mid.pkg --> Leaf"]))
+
+    def test_markers_and_extras(self):
+        write_distribution(self.site, 'webapp', '1.0', [
+            'httpx', 'uvloop; sys_platform != "win32"', 'pywin; sys_platform == "win32"',
+            'backport; python_version < "3.9"', 'socks-lib; extra == "socks"', 'httpx[http2]; extra == "fast"',
+        ])
+        write_distribution(self.site, 'httpx', '1.0', ['h2; extra == "http2"', 'sniffio', 'backport; python_version < "3.9"'])
+        for name in ('uvloop', 'pywin', 'backport', 'socks-lib', 'h2', 'sniffio'):
+            write_distribution(self.site, name, '1.0')
+
+        def edges(package, **target):
+            marker_evaluator = evaluator.Evaluator(evaluator.target_environment(**target))
+            generator = GraphGenerator(self.test_output, 5, sources.InstalledSource(path=[self.site]),
+                                       evaluator=marker_evaluator)
+            self.assertTrue(generator.generate_mermaid(package))
+            return generator.dependencies, marker_evaluator
+
+        linux, _ = edges('webapp', python_version='3.11', platform='linux')
+        self.assertEqual(linux, {"webapp --> httpx", "webapp --> uvloop", "httpx --> sniffio"})
+
+        windows, marker_evaluator = edges('webapp[socks,fast]', python_version='3.8', platform='win32')
+        self.assertEqual(windows, {"webapp --> httpx", "webapp --> pywin", "webapp --> backport",
+                                   "webapp --> socks-lib", "httpx --> h2", "httpx --> sniffio",
+                                   "httpx --> backport"})
+        # The python_version marker is shared by both packages and evaluated once
+        self.assertGreater(marker_evaluator.hits, 0)
+
+    def test_events_and_profile(self):
+        stream = StringIO()
+        event_log = events.EventLog('info', stream, 'json')
+        profiler = events.profiler
+        profiler.reset()
+        profiler.enabled = True
+        try:
+            generator = GraphGenerator(self.test_output, 5, sources.InstalledSource(path=[self.site]), events=event_log)
+            self.assertTrue(generator.generate_mermaid('Top_Pkg'))
+            report = profiler.report()
+        finally:
+            profiler.enabled = False
+            profiler.reset()
+
+        # Per-package detail is debug and filtered out
+        logged = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line["event"] for line in logged], ["installed_packages", "start", "traversed", "saved"])
+        self.assertEqual(logged[-1]["edges"], 2)
+        # Dependency lists are not even built for a debug event nobody prints
+        dropped = []
+        event_log.debug = lambda event, **fields: dropped.append(event)
+        GraphGenerator(self.test_output, 1, sources.InstalledSource(path=[self.site]), events=event_log).generate_mermaid('Top_Pkg')
+        self.assertNotIn("dependencies", dropped)
+        self.assertNotIn("max_depth", dropped)
+
+        self.assertTrue({'traversal', 'metadata', 'output'} <= set(report["phases"]))
+        traversal = report["phases"]["traversal"]
+        self.assertEqual(traversal["count"], 1)
+        self.assertLessEqual(traversal["self_seconds"], traversal["total_seconds"])
+        self.assertEqual(report["counters"]["edges"], 2)
+        self.assertEqual(report["counters"]["lookups"], 3)
+
+        stream = StringIO()
+        events.EventLog('debug', stream).debug("dependencies", package="leaf", found=[])
+        self.assertEqual(stream.getvalue(), "DEBUG   dependencies package=leaf found=-\n")
+        self.assertEqual(events.percentile([1, 2, 3, 4], 0.5), 2)
+        self.assertEqual(events.percentile([1, 2, 3, 4], 0.99), 4)
+
+    def test_matches_pip_show(self):
+        in_process = sources.requirement_names(sources.InstalledSource().requirements('requests'))
+        from_pip = sources.parse_requires(sources.pip_show('requests'))
+        self.assertEqual(sorted(in_process, key=str.lower), sorted(from_pip, key=str.lower))
+
+class TestPipSource(unittest.TestCase):
+    def test_show_many_in_one_call(self):
+        found = sources.pip_show_many(['requests', 'URLLIB3', 'surely-not-installed-package'])
+        self.assertEqual(set(found), {'requests', 'urllib3'})
+        self.assertIn('urllib3', sources.parse_requires(found['requests']))
+
+    def test_breadth_first_matches_in_process(self):
+        output = tempfile.mktemp()
+        from_pip = GraphGenerator(output, 3, sources.PipSource(workers=2, batch_size=2))
+        self.assertTrue(from_pip.generate_mermaid('requests'))
+        in_process = GraphGenerator(output, 3, sources.InstalledSource())
+        self.assertTrue(in_process.generate_mermaid('requests'))
+        os.remove(output)
+        self.assertEqual(from_pip.dependencies, in_process.dependencies)
+
+class TestRepository(unittest.TestCase):
+    def setUp(self):
+        self.repository = tempfile.mkdtemp()
+        self.test_output = os.path.join(self.repository, "graph.txt")
+        write_wheel(self.repository, 'app', '1.0', ['old-lib'])
+        write_wheel(self.repository, 'app', '2.0', ['web-lib>=1', 'tests-only; extra == "test"'])
+        write_sdist(self.repository, 'web-lib', '1.5', "core-lib\n\n[socks]\nsocks-lib\n")
+        write_wheel(self.repository, 'core_lib', '0.9')
+        write_sdist(self.repository, 'core-lib', '0.8')
+
+    def tearDown(self):
+        shutil.rmtree(self.repository, ignore_errors=True)
+
+    def test_index_picks_newest_archive(self):
+        source = sources.RepositorySource(self.repository)
+        self.assertEqual(source.installed, {'app', 'web-lib', 'core-lib'})
+        self.assertEqual(source.archives['app'][0], '2.0')
+        self.assertTrue(source.archives['core-lib'][1].endswith('.whl'))
+        self.assertEqual(sources.requirement_names(source.requirements('app')), ['web-lib'])
+        self.assertEqual(sources.requirement_names(source.requirements('Web_Lib')), ['core-lib'])
+
+    def test_cached_repository_lookups(self):
+        cache_path = os.path.join(self.repository, 'deps.sqlite')
+        for expected in ((0, 1), (1, 0)):
+            source = depcache.CachedSource(sources.RepositorySource(self.repository), cache_path)
+            self.assertEqual(sources.requirement_names(source.requirements('app')), ['web-lib'])
+            self.assertEqual((source.hits, source.misses), expected)
+            source.close()
+
+        # Archives are stamped from the directory entry alone, never read for it
+        source = sources.RepositorySource(self.repository)
+        version, stamp = source.fingerprint('app')
+        self.assertEqual(version, '2.0')
+        self.assertTrue(stamp.startswith('app-2.0-py3-none-any.whl:'))
+
+    def test_archive_read_stops_at_metadata(self):
+        # PKG-INFO with Requires-Dist comes first; the truncated rest is never decompressed
+        path = os.path.join(self.repository, 'big-lib-1.0.tar.gz')
+        with tarfile.open(path, 'w:gz') as sdist:
+            for member_name, data in (("big-lib-1.0/PKG-INFO", metadata_text('big-lib', '1.0', ['core-lib']).encode()),
+                                      ("big-lib-1.0/data.bin", os.urandom(1024 * 1024))):
+                info = tarfile.TarInfo(member_name)
+                info.size = len(data)
+                sdist.addfile(info, BytesIO(data))
+        with open(path, 'r+b') as f:
+            f.truncate(64 * 1024)
+        self.assertEqual(sources.read_archive_requires(path), ['core-lib'])
+
+        # Only METADATA inside *.dist-info counts in a wheel
+        path = os.path.join(self.repository, 'odd_lib-1.0-py3-none-any.whl')
+        with zipfile.ZipFile(path, 'w') as wheel:
+            wheel.writestr("odd_lib/METADATA", "not metadata")
+            wheel.writestr("odd_lib-1.0.dist-info/METADATA", metadata_text('odd-lib', '1.0', ['core-lib']))
+        self.assertEqual(sources.read_archive_requires(path), ['core-lib'])
+
+    def test_graph_without_installing(self):
+        generator = GraphGenerator(self.test_output, 5, sources.RepositorySource(self.repository))
+        self.assertTrue(generator.generate_mermaid('app'))
+        self.assertEqual(generator.dependencies, {"app --> web-lib", "web-lib --> core-lib"})
+        self.assertFalse(generator.generate_mermaid('not-in-repository'))
+
+class TestLayout(unittest.TestCase):
+    def setUp(self):
+        self.edges = [('app', 'web'), ('app', 'cli'), ('web', 'core'), ('cli', 'core'),
+                      ('web', 'a'), ('web', 'b'), ('web', 'c'), ('core', 'app-helper')]
+
+    def test_layered_layout_rows_follow_depth(self):
+        position = layout.layered_layout(self.edges)
+        self.assertEqual(position['app'], (0.0, 0))
+        self.assertEqual({position['web'][1], position['cli'][1]}, {-1})
+        self.assertEqual(position['core'][1], -2)
+        self.assertEqual(position['app-helper'][1], -3)
+        # Children are ordered by where their parents are
+        self.assertLess(position['cli'][0], position['web'][0])
+        self.assertEqual(layout.depths([('x', 'y'), ('y', 'x')]), {'x': 0, 'y': 1})
+
+    def test_level_of_detail(self):
+        collapsed = layout.collapse_leaves(self.edges)
+        self.assertIn(('web', 'web: 3 leaves'), collapsed)
+        self.assertIn(('core', 'app-helper'), collapsed)
+        self.assertEqual(len(collapsed), 6)
+
+        clustered = layout.cluster_by_depth(self.edges, 2)
+        self.assertIn(('web', '+3 more at depth 2'), clustered)
+        self.assertEqual(len({node for edge in clustered for node in edge}), 6)
+
+    def test_cached_layout(self):
+        cache_path = tempfile.mktemp()
+        first = layout.cached_layout(self.edges, cache_path)
+        with open(cache_path) as f:
+            self.assertEqual(json.load(f)["key"], layout.layout_key(self.edges))
+        self.assertEqual(layout.cached_layout(list(reversed(self.edges)), cache_path), first)
+        other = layout.cached_layout(self.edges[:2], cache_path)
+        self.assertEqual(set(other), {'app', 'web', 'cli'})
+        os.remove(cache_path)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,6 +1,9 @@
+import os
+import matplotlib
 import networkx as nx
-import matplotlib.pyplot as plt
 import argparse
+import layout
+import writers
 
 def read_mermaid_graph(file_path):
     edges = []
@@ -13,23 +16,66 @@ def read_mermaid_graph(file_path):
                 edges.append((parts[0].strip(), parts[1].strip()))
     return edges
 
+def read_graph(file_path):
+    # Mermaid, JSON adjacency or binary edge list, as written by main.py
+    with open(file_path, 'rb') as file:
+        head = file.read(len(writers.BINARY_MAGIC))
+    if head == writers.BINARY_MAGIC:
+        names, edges = writers.read_binary(file_path)
+        return [(names[source], names[target]) for source, target in edges]
+    if head.lstrip().startswith(b'['):
+        adjacency = writers.read_json(file_path)
+        return [(source, target) for source, targets in adjacency.items() for target in targets]
+    return read_mermaid_graph(file_path)
+
 def create_graph(edges):
     graph = nx.DiGraph()
     graph.add_edges_from(edges)
     return graph
 
-def visualize_graph(graph):
-    pos = nx.spring_layout(graph)
-    plt.figure(figsize=(10, 8))
-    nx.draw(graph, pos, with_labels=True, node_size=3000, node_color="skyblue", font_size=15, font_weight="bold", arrows=True)
+def visualize_graph(graph, pos=None, output=None):
+    if pos is None:
+        pos = layout.layered_layout(list(graph.edges))
+    # Sizes shrink as the graph grows so large graphs stay readable
+    count = max(graph.number_of_nodes(), 1)
+    node_size = max(50, min(3000, 60000 // count))
+    font_size = max(4, min(15, 300 // count))
+    width = max(10, min(60, len({x for x, _ in pos.values()}) * 0.8))
+    height = max(8, min(40, len({y for _, y in pos.values()}) * 1.5))
+
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(width, height))
+    nx.draw(graph, pos, with_labels=True, node_size=node_size, node_color="skyblue", font_size=font_size, font_weight="bold", arrows=True)
     plt.title("Mermaid Graph Visualization")
-    plt.show()
+    if output:
+        plt.savefig(output, bbox_inches="tight")
+        plt.close()
+    else:
+        plt.show()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Visualize a Mermaid graph.")
     parser.add_argument("--path", type=str, help="Path to the Mermaid graph file")
+    parser.add_argument("--output", help="Render to this PNG or SVG file instead of opening a window")
+    parser.add_argument("--collapse-leaves", action="store_true", help="Show the leaf dependencies of each package as one node")
+    parser.add_argument("--max-per-depth", type=int, help="Merge the rest of each depth into one node past this many")
+    parser.add_argument("--layout-cache", help="File to keep the computed layout in (default: next to the graph)")
+    parser.add_argument("--spring", action="store_true", help="Use networkx spring layout instead of the layered one")
     args = parser.parse_args()
 
-    edges = read_mermaid_graph(args.path)
+    if args.output:
+        # No display needed; must be chosen before pyplot is imported
+        matplotlib.use("Agg")
+
+    edges = read_graph(args.path)
+    if args.collapse_leaves:
+        edges = layout.collapse_leaves(edges)
+    if args.max_per_depth:
+        edges = layout.cluster_by_depth(edges, args.max_per_depth)
     graph = create_graph(edges)
-    visualize_graph(graph)
\ No newline at end of file
+
+    if args.spring:
+        pos = nx.spring_layout(graph)
+    else:
+        pos = layout.cached_layout(edges, args.layout_cache or os.path.splitext(args.path)[0] + ".layout.json")
+    visualize_graph(graph, pos, args.output)
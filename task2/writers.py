@@ -0,0 +1,166 @@
+import json
+import os
+import struct
+
+# Graph writers take edges one at a time, as the traversal finds them, and
+# write them straight out. Every writer has the same surface:
+#   write_edge(source, target)
+#   close()     finish the file and move it into place
+#   abort()     drop the partial file
+# Output goes to a temporary file next to the target, so a failed run never
+# leaves half a graph behind.
+
+BUFFER_SIZE = 1024 * 1024
+BINARY_MAGIC = b'DEPGRAPH\x01'
+BINARY_NODE = struct.Struct('<cH')
+BINARY_EDGE = struct.Struct('<cII')
+
+
+class GraphWriter:
+    binary = False
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = path + '.tmp'
+        self.file = open(self.temp_path, 'wb' if self.binary else 'w', buffering=BUFFER_SIZE)
+        self.edges = 0
+        self.start()
+
+    def start(self):
+        pass
+
+    def finish(self):
+        pass
+
+    def write_edge(self, source, target):
+        raise NotImplementedError
+
+    def close(self):
+        self.finish()
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class MermaidWriter(GraphWriter):
+    def start(self):
+        self.file.write("graph TD\n")
+
+    def write_edge(self, source, target):
+        self.file.write(f"    {source} --> {target}\n")
+        self.edges += 1
+
+
+class DotWriter(GraphWriter):
+    def start(self):
+        self.file.write("digraph dependencies {\n")
+
+    def write_edge(self, source, target):
+        self.file.write(f"    {json.dumps(source)} -> {json.dumps(target)};\n")
+        self.edges += 1
+
+    def finish(self):
+        self.file.write("}\n")
+
+
+class JsonWriter(GraphWriter):
+    # [["package", ["dependency", ...]], ...]. The traversal usually emits all
+    # edges of a package together, so each record is closed as soon as the next
+    # one starts. A package expanded again with other extras gets a further
+    # record; read_json merges them. Packages without dependencies are listed
+    # at the end.
+    def start(self):
+        self.current = None
+        self.sources = set()
+        self.targets = set()
+        self.file.write("[")
+
+    def _open_record(self, name):
+        self.file.write(("\n" if self.current is None else "]],\n") + f"  [{json.dumps(name)}, [")
+        self.sources.add(name)
+        self.current = name
+
+    def write_edge(self, source, target):
+        if source != self.current:
+            self._open_record(source)
+        else:
+            self.file.write(", ")
+        self.file.write(json.dumps(target))
+        self.targets.add(target)
+        self.edges += 1
+
+    def finish(self):
+        for name in sorted(self.targets - self.sources):
+            self._open_record(name)
+        self.file.write("]]\n]\n" if self.sources else "]\n")
+
+
+class BinaryWriter(GraphWriter):
+    # Records after a magic header: b'N' + u16 length + UTF-8 name declares the
+    # next node number; b'E' + u32 source + u32 target is an edge.
+    binary = True
+
+    def start(self):
+        self.nodes = {}
+        self.file.write(BINARY_MAGIC)
+
+    def _node(self, name):
+        number = self.nodes.get(name)
+        if number is None:
+            number = len(self.nodes)
+            self.nodes[name] = number
+            data = name.encode('utf-8')
+            self.file.write(BINARY_NODE.pack(b'N', len(data)))
+            self.file.write(data)
+        return number
+
+    def write_edge(self, source, target):
+        source_number = self._node(source)
+        target_number = self._node(target)
+        self.file.write(BINARY_EDGE.pack(b'E', source_number, target_number))
+        self.edges += 1
+
+
+WRITERS = {
+    'mermaid': MermaidWriter,
+    'dot': DotWriter,
+    'json': JsonWriter,
+    'binary': BinaryWriter,
+}
+
+
+def read_binary(path):
+    # (node names, [(source, target), ...]) from a BinaryWriter file
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(BINARY_MAGIC):
+        raise ValueError(f"{path} is not a binary edge list")
+    names = []
+    edges = []
+    position = len(BINARY_MAGIC)
+    while position < len(data):
+        if data[position:position + 1] == b'N':
+            _, length = BINARY_NODE.unpack_from(data, position)
+            position += BINARY_NODE.size
+            names.append(data[position:position + length].decode('utf-8'))
+            position += length
+        else:
+            _, source, target = BINARY_EDGE.unpack_from(data, position)
+            position += BINARY_EDGE.size
+            edges.append((source, target))
+    return names, edges
+
+
+def read_json(path):
+    # {package: [dependency, ...]} from a JsonWriter file, records of one package merged
+    with open(path, 'r') as f:
+        records = json.load(f)
+    adjacency = {}
+    for source, targets in records:
+        merged = adjacency.setdefault(source, [])
+        merged.extend(target for target in targets if target not in merged)
+    return adjacency